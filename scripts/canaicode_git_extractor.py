@@ -1,12 +1,29 @@
 import argparse
+import csv
+import hashlib
+import io
+import json
 import os
+import sqlite3
 import tempfile
 import shutil
+import subprocess
+import sys
+import threading
+import numpy as np
 import pandas as pd
+import xlsxwriter
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import groupby, islice
+from operator import itemgetter
 from datetime import date, datetime, time, timedelta
-from typing import List, Dict
-from git import Repo
-from pydantic import BaseModel
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterator, List, NamedTuple, TextIO, Tuple
+from git import Git, GitCommandError, Repo
+from pydantic import BaseModel, ConfigDict, SkipValidation, TypeAdapter
 
 
 class CommitMetrics(BaseModel):
@@ -19,67 +36,1487 @@ class CommitMetrics(BaseModel):
     removed_lines: int
 
 
-class GitRepoConsumer:
-    __DEFAULT_LANG = "Other"
-    __EXT_TO_LANG = {
-        ".py": "Python", ".ts": "TypeScript", ".js": "JavaScript",
-        ".tsx": "TypeScript", ".jsx": "JavaScript", ".java": "Java",
-        ".rb": "Ruby", ".go": "Go", ".rs": "Rust", ".cpp": "C++",
-        ".c": "C", ".cs": "C#", ".php": "PHP", ".html": "HTML",
-        ".css": "CSS", ".json": "JSON", ".txt": "Plain Text",
-        ".md": "Markdown"
+class CommitRow(NamedTuple):
+    # Same fields as CommitMetrics without the per-instance validation cost. Rows
+    # are built for every file a commit touches, so extraction and the sinks work
+    # on these and only the public API turns them into CommitMetrics.
+    hash: str
+    repository: str
+    date: datetime
+    author: str | None
+    language: str
+    added_lines: int
+    removed_lines: int
+
+
+# Validates a whole list of rows in one call at the API boundary
+COMMIT_METRICS_LIST = TypeAdapter(List[CommitMetrics])
+
+
+class Table(NamedTuple):
+    # Layout of an output table. Each column has a kind: "string", "category"
+    # (dictionary-encoded string), "date", "int32" or "int64".
+    name: str
+    columns: Tuple[str, ...]
+    kinds: Tuple[str, ...]
+    # Excel output gets one sheet per repository instead of one named after the table
+    split_by_repository: bool = False
+
+
+# One row per changed file, as in CommitMetrics
+FLAT_TABLE = Table(
+    "commits",
+    CommitRow._fields,
+    ("string", "category", "date", "category", "category", "int32", "int32"),
+    split_by_repository=True,
+)
+# Normalized layout: each commit once, and its files keyed by the same commit_id
+COMMITS_TABLE = Table(
+    "commits",
+    ("commit_id", "hash", "repository", "date", "author"),
+    ("int64", "string", "category", "date", "category"),
+)
+FILE_CHANGES_TABLE = Table(
+    "file_changes",
+    ("commit_id", "language", "added_lines", "removed_lines"),
+    ("int64", "category", "int32", "int32"),
+)
+# --aggregate layouts: the CommitRow fields a row is grouped by, then its totals.
+# `commits` counts distinct commits and `files` the changed files in a group.
+AGGREGATE_TABLES = {
+    "commit-language": Table(
+        "commit_languages",
+        ("hash", "repository", "date", "author", "language", "files", "added_lines", "removed_lines"),
+        ("string", "category", "date", "category", "category", "int32", "int64", "int64"),
+        split_by_repository=True,
+    ),
+    "day-author-language": Table(
+        "day_author_languages",
+        ("repository", "date", "author", "language", "commits", "files", "added_lines", "removed_lines"),
+        ("category", "date", "category", "category", "int32", "int32", "int64", "int64"),
+        split_by_repository=True,
+    ),
+    "day-language": Table(
+        "day_languages",
+        ("repository", "date", "language", "commits", "files", "added_lines", "removed_lines"),
+        ("category", "date", "category", "int32", "int32", "int64", "int64"),
+        split_by_repository=True,
+    ),
+}
+
+
+class CommitColumns:
+    # Typed column buffers for a batch of rows: line counts as int32, dates as
+    # epoch seconds and repeated strings as dictionary codes, so a DataFrame is
+    # built from ready arrays instead of one Python object per cell
+    __TYPECODES = {"category": "i", "date": "q", "int32": "i", "int64": "q"}
+    __DTYPES = {"category": np.int32, "date": np.int64, "int32": np.int32, "int64": np.int64}
+    __EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+    def __init__(self, table: Table = FLAT_TABLE):
+        self.table = table
+        # Value -> code, in order of first appearance; None is stored as code -1
+        self.categories: Dict[str, Dict[str | None, int]] = {
+            column: {None: -1} for column, kind in zip(table.columns, table.kinds) if kind == "category"
+        }
+        self.__epochs: Dict[datetime, int] = {}
+        self.clear()
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def clear(self) -> None:
+        # Drops the rows but keeps the dictionaries, so codes stay stable
+        self.buffers: Dict[str, Any] = {
+            column: [] if kind == "string" else array(self.__TYPECODES[kind])
+            for column, kind in zip(self.table.columns, self.table.kinds)
+        }
+        self.__length = 0
+
+    def append(self, rows: List[Tuple]) -> None:
+        # Large batches are cheapest: every column is filled by a C-level map over
+        # the rows rather than per-cell Python code
+        for index, (column, kind) in enumerate(zip(self.table.columns, self.table.kinds)):
+            values = list(map(itemgetter(index), rows))
+            if kind == "category":
+                categories = self.categories[column]
+                for value in dict.fromkeys(values):
+                    if value not in categories:
+                        categories[value] = len(categories) - 1
+                values = map(categories.__getitem__, values)
+            elif kind == "date":
+                epochs = self.__epochs
+                for day in set(values) - epochs.keys():
+                    # Dates are local midnights, kept as naive wall-clock time
+                    epochs[day] = (day.toordinal() - self.__EPOCH_ORDINAL) * 86400
+                values = map(epochs.__getitem__, values)
+            self.buffers[column].extend(values)
+        self.__length += len(rows)
+
+    def values(self, column: str) -> np.ndarray:
+        # A copy of a numeric column (codes for categories, epoch seconds for dates)
+        kind = self.table.kinds[self.table.columns.index(column)]
+        return np.array(self.buffers[column], dtype=self.__DTYPES[kind])
+
+    def dictionary(self, column: str) -> List[str]:
+        return list(self.categories[column])[1:]
+
+    def to_frame(self) -> pd.DataFrame:
+        # Buffers are copied, so appending after this call is still safe
+        data: Dict[str, Any] = {}
+        for column, kind in zip(self.table.columns, self.table.kinds):
+            if kind == "string":
+                data[column] = list(self.buffers[column])
+            elif kind == "category":
+                data[column] = pd.Categorical.from_codes(self.values(column), categories=self.dictionary(column))
+            elif kind == "date":
+                data[column] = self.values(column).astype("datetime64[s]")
+            else:
+                data[column] = self.values(column)
+        return pd.DataFrame(data)
+
+
+class RepositoryCheckpoint(BaseModel):
+    # Ref tips seen by the last run and the window it extracted
+    refs: Dict[str, str]
+    start: date
+    end: date
+    extracted_on: date
+    # `git ls-remote` fingerprint of the remote's branches and tags, if it is remote
+    fingerprint: str | None = None
+
+    def covers(self, start: date, end: date) -> bool:
+        # Commits reachable from the recorded tips can't be newer than the run that
+        # recorded them, so only the part of the window up to that day matters
+        return self.start <= start and min(end, self.extracted_on) <= self.end
+
+
+class RepositoryResult(BaseModel):
+    repository: str
+    # Rows were produced by the extractor itself, so they are not validated again
+    rows: SkipValidation[List[CommitRow]]
+    checkpoint: RepositoryCheckpoint | None
+    # True when the remote was unchanged since the checkpoint and was not cloned
+    skipped: bool = False
+
+
+class PartialExportError(Exception):
+    # A repository failed after some of its rows were already written to the
+    # sink. They can't be taken back, so the whole export is incomplete and
+    # the run must fail instead of moving on to the next repository.
+    pass
+
+
+class ExtractionState(BaseModel):
+    # Portable JSON state for --state-file, keyed by the repository URL/path as given
+    version: int = 1
+    repositories: Dict[str, RepositoryCheckpoint] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "ExtractionState":
+        if not os.path.isfile(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.model_validate_json(f.read())
+
+    def save(self, path: str) -> None:
+        # Write to a temporary file first so an interrupted run never leaves a truncated state
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.model_dump_json(indent=2))
+        os.replace(temp_path, path)
+
+
+# (added, removed, path) for every file a commit touches
+Numstat = List[Tuple[int, int, str]]
+
+
+class MetricsCache:
+    # A commit's numstat against a given parent never changes, so rows are stored
+    # per (commit sha, first parent sha) and reused across runs and repositories.
+    # Numstat limited by path filters is stored under a `scope` naming the filters.
+    __BATCH_SIZE = 500
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.hits = 0
+        self.misses = 0
+        self.__connection: sqlite3.Connection | None = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Worker processes open their own connection
+        state = self.__dict__.copy()
+        state["_MetricsCache__connection"] = None
+        return state
+
+    def get_many(self, keys: List[Tuple[str, str]], scope: str = "") -> Dict[Tuple[str, str], Numstat]:
+        connection = self.__connect()
+        wanted = {self.__stored_key(key, scope): key for key in keys}
+        found: Dict[Tuple[str, str], Numstat] = {}
+        now = int(datetime.now().timestamp())
+
+        shas = sorted({commit_sha for commit_sha, _ in wanted})
+        for i in range(0, len(shas), self.__BATCH_SIZE):
+            batch = shas[i:i + self.__BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = connection.execute(
+                f"SELECT commit_sha, parent_sha, changes FROM numstat WHERE commit_sha IN ({placeholders})",
+                batch,
+            ).fetchall()
+            for commit_sha, parent_sha, changes in rows:
+                key = wanted.get((commit_sha, parent_sha))
+                if key is not None:
+                    found[key] = [tuple(change) for change in json.loads(changes)]
+            with connection:
+                connection.execute(
+                    f"UPDATE numstat SET last_used = ? WHERE commit_sha IN ({placeholders})",
+                    [now, *batch],
+                )
+
+        self.hits += len(found)
+        self.misses += len(wanted) - len(found)
+        return found
+
+    def put_many(self, entries: Dict[Tuple[str, str], Numstat], scope: str = "") -> None:
+        now = int(datetime.now().timestamp())
+        with self.__connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO numstat (commit_sha, parent_sha, changes, last_used) VALUES (?, ?, ?, ?)",
+                [
+                    (*self.__stored_key(key, scope), json.dumps(changes), now)
+                    for key, changes in entries.items()
+                ],
+            )
+
+    def prune(self, max_age_days: int) -> int:
+        # Drops entries that no run has read or written for `max_age_days`
+        cutoff = int((datetime.now() - timedelta(days=max_age_days)).timestamp())
+        with self.__connect() as connection:
+            return connection.execute("DELETE FROM numstat WHERE last_used < ?", (cutoff,)).rowcount
+
+    def close(self) -> None:
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def __stored_key(self, key: Tuple[str, str], scope: str) -> Tuple[str, str]:
+        # Unscoped entries keep the plain parent sha, so existing caches stay valid
+        commit_sha, parent_sha = key
+        return (commit_sha, f"{parent_sha} {scope}") if scope else key
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # WAL lets parallel workers read while another one writes
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS numstat ("
+                "commit_sha TEXT NOT NULL, "
+                "parent_sha TEXT NOT NULL, "
+                "changes TEXT NOT NULL, "
+                "last_used INTEGER NOT NULL, "
+                "PRIMARY KEY (commit_sha, parent_sha)"
+                ") WITHOUT ROWID"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS numstat_last_used ON numstat (last_used)")
+            self.__connection = connection
+        return self.__connection
+
+
+class RowSink(ABC):
+    # Receives rows while extraction runs and writes them out incrementally.
+    # Output files are only created once the first row arrives. Rows are tuples
+    # laid out as `table` describes; by default that is the flat CommitRow.
+    # With `open_output`, sinks that support it write to the binary stream it
+    # returns for their path instead of creating the file.
+    def __init__(self, path: str, table: Table = FLAT_TABLE, open_output: Callable[[str], BinaryIO] | None = None):
+        self.path = path
+        self.table = table
+        self.columns = list(table.columns)
+        self.open_output = open_output
+        self.repository: str | None = None
+        self.rows_written = 0
+
+    @property
+    def paths(self) -> List[str]:
+        # Files the sink writes to
+        return [self.path]
+
+    def open_repository(self, repository: str) -> None:
+        self.repository = repository
+
+    def write(self, rows: List[Tuple]) -> None:
+        if rows:
+            self._write_rows(rows)
+            self.rows_written += len(rows)
+
+    def close(self) -> None:
+        pass
+
+    @abstractmethod
+    def _write_rows(self, rows: List[Tuple]) -> None:
+        ...
+
+    def _open_binary(self) -> BinaryIO:
+        if self.open_output is not None:
+            return self.open_output(self.path)
+        return open(self.path, "wb")
+
+
+class ExcelSink(RowSink):
+    # Written row by row in xlsxwriter's constant_memory mode, so memory does not
+    # grow with the number of rows. Tables split by repository get one sheet per
+    # repository, others one sheet named after the table. A sheet that runs out
+    # of rows continues on "repo (2)", "repo (3)", ...
+    __MAX_SHEET_NAME = 31
+    # Excel's 1,048,576 rows, minus the header
+    __MAX_DATA_ROWS = 1_048_575
+    __HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+    __DATE_FORMAT = {"num_format": "yyyy-mm-dd hh:mm:ss"}
+    # Day zero of Excel's date serials (valid from March 1900 on)
+    __EXCEL_EPOCH = datetime(1899, 12, 30)
+
+    def __init__(self, path: str, table: Table = FLAT_TABLE):
+        super().__init__(path, table)
+        self.__sheet_per_repository = table.split_by_repository
+        self.__workbook: xlsxwriter.Workbook | None = None
+        self.__header_format: Any = None
+        self.__date_format: Any = None
+        self.__date_serials: Dict[datetime, float] = {}
+        self.__sheet: Any = None
+        self.__cell_writers: List[Any] = []
+        self.__sheet_rows = 0
+        self.__sheet_names: set[str] = set()
+
+    def open_repository(self, repository: str) -> None:
+        super().open_repository(repository)
+        if self.__sheet_per_repository:
+            # The sheet is only added once the repository has rows
+            self.__sheet = None
+
+    def close(self) -> None:
+        if self.__workbook is not None:
+            self.__workbook.close()
+            self.__workbook = None
+
+    def _write_rows(self, rows: List[Tuple]) -> None:
+        for values in rows:
+            if self.__sheet is None or self.__sheet_rows == self.__MAX_DATA_ROWS:
+                self.__add_sheet()
+            self.__sheet_rows += 1
+            row = self.__sheet_rows
+            for column, (write_cell, value) in enumerate(zip(self.__cell_writers, values)):
+                if value is not None:
+                    write_cell(row, column, value)
+
+    def __write_date(self, row: int, column: int, day: datetime) -> None:
+        # All rows of a day share one date serial
+        serial = self.__date_serials.get(day)
+        if serial is None:
+            serial = self.__date_serials[day] = (day - self.__EXCEL_EPOCH) / timedelta(days=1)
+        self.__sheet.write_number(row, column, serial, self.__date_format)
+
+    def __add_sheet(self) -> None:
+        if self.__workbook is None:
+            self.__workbook = xlsxwriter.Workbook(self.path, {"constant_memory": True})
+            self.__header_format = self.__workbook.add_format(self.__HEADER_FORMAT)
+            self.__date_format = self.__workbook.add_format(self.__DATE_FORMAT)
+
+        name = (self.repository or self.table.name) if self.__sheet_per_repository else self.table.name
+        self.__sheet = self.__workbook.add_worksheet(self.__sheet_name(name))
+        self.__sheet.write_row(0, 0, self.columns, self.__header_format)
+        self.__sheet_rows = 0
+
+        # Typed writes skip xlsxwriter's per-cell type dispatch
+        writers = {
+            "string": self.__sheet.write_string,
+            "category": self.__sheet.write_string,
+            "date": self.__write_date,
+            "int32": self.__sheet.write_number,
+            "int64": self.__sheet.write_number,
+        }
+        self.__cell_writers = [writers[kind] for kind in self.table.kinds]
+
+    def __sheet_name(self, repository: str) -> str:
+        # Excel compares sheet names case-insensitively; repositories sharing a
+        # name get " (2)", " (3)", ... instead of overwriting each other
+        name = repository[:self.__MAX_SHEET_NAME]
+        suffix_number = 1
+        while name.lower() in self.__sheet_names:
+            suffix_number += 1
+            suffix = f" ({suffix_number})"
+            name = repository[:self.__MAX_SHEET_NAME - len(suffix)] + suffix
+        self.__sheet_names.add(name.lower())
+        return name
+
+
+class CsvSink(RowSink):
+    def __init__(self, path: str, table: Table = FLAT_TABLE, open_output: Callable[[str], BinaryIO] | None = None):
+        super().__init__(path, table, open_output)
+        self.__file: TextIO | None = None
+        self.__writer: Any = None
+
+    def close(self) -> None:
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def _write_rows(self, rows: List[Tuple]) -> None:
+        if self.__file is None:
+            self.__file = io.TextIOWrapper(self._open_binary(), encoding="utf-8", newline="")
+            self.__writer = csv.writer(self.__file)
+            self.__writer.writerow(self.columns)
+
+        self.__writer.writerows(rows)
+
+
+class JsonLinesSink(RowSink):
+    # One JSON object per row, dates in ISO 8601
+    def __init__(self, path: str, table: Table = FLAT_TABLE, open_output: Callable[[str], BinaryIO] | None = None):
+        super().__init__(path, table, open_output)
+        self.__file: TextIO | None = None
+
+    def close(self) -> None:
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def _write_rows(self, rows: List[Tuple]) -> None:
+        if self.__file is None:
+            self.__file = io.TextIOWrapper(self._open_binary(), encoding="utf-8")
+
+        self.__file.writelines(
+            f"{json.dumps(dict(zip(self.columns, row)), default=datetime.isoformat)}\n" for row in rows
+        )
+
+
+class ColumnarSink(RowSink):
+    # Base for the pyarrow formats. Rows are collected into CommitColumns and
+    # written in record batches with the "category" columns dictionary-encoded.
+    # pyarrow is only needed for these formats.
+    __BATCH_SIZE = 100_000
+    format_name = ""
+    compressions: Tuple[str, ...] = ()
+    default_compression = "none"
+
+    def __init__(
+        self,
+        path: str,
+        table: Table = FLAT_TABLE,
+        compression: str | None = None,
+        open_output: Callable[[str], BinaryIO] | None = None,
+    ):
+        super().__init__(path, table, open_output)
+        try:
+            import pyarrow
+        except ImportError:
+            raise ValueError(
+                f"{self.format_name} output requires pyarrow. Install it with: pip install pyarrow"
+            )
+
+        compression = compression or self.default_compression
+        if compression != "none" and compression not in self.compressions:
+            raise ValueError(
+                f"{self.format_name} output does not support {compression} compression. "
+                f"Use one of: none, {', '.join(self.compressions)}"
+            )
+
+        self.compression = None if compression == "none" else compression
+        self.pa = pyarrow
+        types = {
+            "string": pyarrow.string(),
+            "category": pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+            "date": pyarrow.timestamp("s"),
+            "int32": pyarrow.int32(),
+            "int64": pyarrow.int64(),
+        }
+        self.schema = pyarrow.schema([(column, types[kind]) for column, kind in zip(table.columns, table.kinds)])
+        self.__writer: Any = None
+        self.__stream: BinaryIO | None = None
+        # Dictionaries keep growing across batches, so every batch only adds to them
+        self.__columns = CommitColumns(table)
+        self.__rows: List[Tuple] = []
+
+    def close(self) -> None:
+        self.__flush()
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+        if self.__stream is not None:
+            self.__stream.close()
+            self.__stream = None
+
+    def _write_rows(self, rows: List[Tuple]) -> None:
+        self.__rows.extend(rows)
+        if len(self.__rows) >= self.__BATCH_SIZE:
+            self.__flush()
+
+    @abstractmethod
+    def _open_writer(self, where: Any) -> Any:
+        ...
+
+    @abstractmethod
+    def _write_batch(self, writer: Any, batch: Any) -> None:
+        ...
+
+    def __flush(self) -> None:
+        if not self.__rows:
+            return
+        if self.__writer is None:
+            # pyarrow writes to a path itself; streams from open_output are closed here
+            if self.open_output is not None:
+                self.__stream = self.open_output(self.path)
+            self.__writer = self._open_writer(self.__stream or self.path)
+
+        self.__columns.append(self.__rows)
+        self._write_batch(self.__writer, self.__record_batch(self.__columns))
+        self.__columns.clear()
+        self.__rows = []
+
+    def __record_batch(self, columns: CommitColumns) -> Any:
+        pa = self.pa
+        arrays = []
+        for field, kind in zip(self.schema, self.table.kinds):
+            if kind == "string":
+                arrays.append(pa.array(columns.buffers[field.name], field.type))
+            elif kind == "category":
+                codes = columns.values(field.name)
+                arrays.append(pa.DictionaryArray.from_arrays(
+                    pa.array(codes, mask=codes < 0),
+                    pa.array(columns.dictionary(field.name), pa.string()),
+                ))
+            else:
+                arrays.append(pa.array(columns.values(field.name), field.type))
+        return pa.record_batch(arrays, schema=self.schema)
+
+
+class ParquetSink(ColumnarSink):
+    # One row group per batch
+    format_name = "Parquet"
+    compressions = ("zstd", "snappy", "gzip", "lz4", "brotli")
+    default_compression = "zstd"
+
+    def _open_writer(self, where: Any) -> Any:
+        import pyarrow.parquet
+
+        return pyarrow.parquet.ParquetWriter(
+            where,
+            self.schema,
+            compression=self.compression or "none",
+            use_dictionary=[column for column, kind in zip(self.columns, self.table.kinds) if kind == "category"],
+        )
+
+    def _write_batch(self, writer: Any, batch: Any) -> None:
+        writer.write_table(self.pa.Table.from_batches([batch]))
+
+
+class ArrowSink(ColumnarSink):
+    # Arrow IPC file (Feather v2). Uncompressed by default so readers can
+    # memory-map it and use the columns without copying.
+    format_name = "Arrow"
+    compressions = ("zstd", "lz4")
+
+    def _open_writer(self, where: Any) -> Any:
+        options = self.pa.ipc.IpcWriteOptions(compression=self.compression, emit_dictionary_deltas=True)
+        return self.pa.ipc.new_file(where, self.schema, options=options)
+
+    def _write_batch(self, writer: Any, batch: Any) -> None:
+        writer.write_batch(batch)
+
+
+class NormalizedSink(RowSink):
+    # Writes every commit once to a `commits` table and its files to a
+    # `file_changes` table, joined on an integer commit_id that counts up across
+    # the run. Each table goes to its own file: NAME_commits.EXT and
+    # NAME_file_changes.EXT for an output path of NAME.EXT.
+    def __init__(self, path: str, create_table_sink: Callable[[str, Table], RowSink]):
+        super().__init__(path)
+        stem, extension = os.path.splitext(path)
+        self.commits = create_table_sink(f"{stem}_commits{extension}", COMMITS_TABLE)
+        self.file_changes = create_table_sink(f"{stem}_file_changes{extension}", FILE_CHANGES_TABLE)
+        self.__next_commit_id = 1
+
+    @property
+    def paths(self) -> List[str]:
+        return [self.commits.path, self.file_changes.path]
+
+    def open_repository(self, repository: str) -> None:
+        super().open_repository(repository)
+        self.commits.open_repository(repository)
+        self.file_changes.open_repository(repository)
+
+    def close(self) -> None:
+        self.commits.close()
+        self.file_changes.close()
+
+    def _write_rows(self, rows: List[Tuple]) -> None:
+        commits: List[Tuple] = []
+        file_changes: List[Tuple] = []
+        # A commit's rows are always next to each other
+        for _, group in groupby(rows, key=itemgetter(0)):
+            commit_rows: List[CommitRow] = list(group)
+            commit_id = self.__next_commit_id
+            self.__next_commit_id += 1
+
+            first = commit_rows[0]
+            commits.append((commit_id, first.hash, first.repository, first.date, first.author))
+            file_changes.extend((commit_id, row.language, row.added_lines, row.removed_lines) for row in commit_rows)
+        self.commits.write(commits)
+        self.file_changes.write(file_changes)
+
+
+class AggregatingSink(RowSink):
+    # Collapses rows into per-commit or per-day totals (see AGGREGATE_TABLES)
+    # before they reach `sink`. Rows arrive a day at a time for each repository,
+    # so only the groups of the current commit or day are held in memory.
+    __TOTALS = ("commits", "files", "added_lines", "removed_lines")
+
+    def __init__(self, sink: RowSink):
+        super().__init__(sink.path, sink.table)
+        self.sink = sink
+        key_columns = [column for column in sink.table.columns if column not in self.__TOTALS]
+        self.__key = itemgetter(*(CommitRow._fields.index(column) for column in key_columns))
+        self.__per_commit = "hash" in key_columns
+        self.__count_commits = "commits" in sink.table.columns
+        # Group key -> [commits, files, added lines, removed lines]
+        self.__groups: Dict[Any, List[int]] = {}
+        self.__scope: Any = None
+
+    @property
+    def paths(self) -> List[str]:
+        return self.sink.paths
+
+    def open_repository(self, repository: str) -> None:
+        self.__flush()
+        super().open_repository(repository)
+        self.sink.open_repository(repository)
+
+    def close(self) -> None:
+        self.__flush()
+        self.sink.close()
+
+    def _write_rows(self, rows: List[Tuple]) -> None:
+        for hexsha, group in groupby(rows, key=itemgetter(0)):
+            commit_rows: List[CommitRow] = list(group)
+            scope = hexsha if self.__per_commit else commit_rows[0].date
+            if scope != self.__scope:
+                self.__flush()
+                self.__scope = scope
+
+            counted = set()
+            for row in commit_rows:
+                key = self.__key(row)
+                totals = self.__groups.get(key)
+                if totals is None:
+                    totals = self.__groups[key] = [0, 0, 0, 0]
+                if key not in counted:
+                    counted.add(key)
+                    totals[0] += 1
+                totals[1] += 1
+                totals[2] += row.added_lines
+                totals[3] += row.removed_lines
+
+    def __flush(self) -> None:
+        first_total = 0 if self.__count_commits else 1
+        self.sink.write([(*key, *totals[first_total:]) for key, totals in self.__groups.items()])
+        self.__groups = {}
+        self.__scope = None
+
+
+class PartitionedSink(RowSink):
+    # Writes each repository's rows of a day to their own file, DIR/REPO_YYYY-MM-DD.EXT
+    # for an output directory DIR. A partition's bytes only depend on that day's
+    # commits, so unchanged days produce identical files and can be skipped by
+    # hash when uploading. Rows arrive a day at a time for each repository, so
+    # only the current day's partition is open.
+    def __init__(
+        self,
+        path: str,
+        extension: str,
+        create_partition_sink: Callable[[str, Table], RowSink],
+        table: Table = FLAT_TABLE,
+    ):
+        super().__init__(path, table)
+        self.extension = extension
+        self.__create_partition_sink = create_partition_sink
+        self.__date_column = table.columns.index("date")
+        self.__partition: RowSink | None = None
+        self.__day = ""
+        self.__paths: List[str] = []
+        # Repositories with the same name get numbered partitions
+        self.__name_counts: Dict[str, int] = {}
+        self.__prefix = ""
+
+    @property
+    def paths(self) -> List[str]:
+        return list(self.__paths)
+
+    def open_repository(self, repository: str) -> None:
+        self.__close_partition()
+        self.__day = ""
+        super().open_repository(repository)
+        count = self.__name_counts.get(repository, 0) + 1
+        self.__name_counts[repository] = count
+        self.__prefix = repository if count == 1 else f"{repository}-{count}"
+
+    def close(self) -> None:
+        self.__close_partition()
+
+    def _write_rows(self, rows: List[Tuple]) -> None:
+        for day, group in groupby(rows, key=lambda row: row[self.__date_column].strftime("%Y-%m-%d")):
+            if self.__partition is None or day != self.__day:
+                if day < self.__day:
+                    # Reopening the day's partition would overwrite its rows
+                    raise ValueError(f"Rows for {day} of {self.repository} arrived after {self.__day}")
+                self.__close_partition()
+                os.makedirs(self.path, exist_ok=True)
+                partition_path = os.path.join(self.path, f"{self.__prefix}_{day}{self.extension}")
+                self.__partition = self.__create_partition_sink(partition_path, self.table)
+                self.__partition.open_repository(self.repository)
+                self.__day = day
+                self.__paths.append(partition_path)
+            self.__partition.write(list(group))
+
+    def __close_partition(self) -> None:
+        if self.__partition is not None:
+            self.__partition.close()
+            self.__partition = None
+
+
+OUTPUT_FORMATS: Dict[str, type] = {
+    "xlsx": ExcelSink,
+    "csv": CsvSink,
+    "jsonl": JsonLinesSink,
+    "parquet": ParquetSink,
+    "arrow": ArrowSink,
+}
+OUTPUT_EXTENSIONS = {
+    ".xlsx": "xlsx", ".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet",
+    ".arrow": "arrow", ".feather": "arrow",
+}
+
+
+def create_sink(
+    path: str,
+    output_format: str | None = None,
+    compression: str | None = None,
+    normalized: bool = False,
+    aggregate: str | None = None,
+    open_output: Callable[[str], BinaryIO] | None = None,
+    partitioned: bool = False,
+) -> RowSink:
+    # Without an explicit format, the format follows the file extension. With
+    # `partitioned`, `path` is the output directory.
+    if output_format is None and partitioned:
+        raise ValueError("Partitioned output needs an explicit format")
+    if output_format is None:
+        output_format = OUTPUT_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if output_format is None:
+            raise ValueError(
+                f"Unsupported output format: {path}. "
+                f"Use a {', '.join(OUTPUT_EXTENSIONS)} file or pass --format."
+            )
+
+    sink_class = OUTPUT_FORMATS[output_format]
+    options: Dict[str, Any] = {}
+    if issubclass(sink_class, ColumnarSink):
+        options["compression"] = compression
+    elif compression not in (None, "none"):
+        raise ValueError("Compression is only supported for parquet and arrow output")
+    if open_output is not None:
+        # xlsxwriter needs a file it can seek in
+        if sink_class is ExcelSink:
+            raise ValueError("xlsx output can't be streamed. Use csv, jsonl, parquet or arrow")
+        options["open_output"] = open_output
+
+    if normalized and aggregate is not None:
+        raise ValueError("Aggregated output can't be normalized")
+    if partitioned:
+        # commit_id counts across the whole run, so normalized partitions would not be stable
+        if normalized:
+            raise ValueError("Partitioned output can't be normalized")
+        if sink_class is ExcelSink:
+            raise ValueError("xlsx output can't be partitioned. Use csv, jsonl, parquet or arrow")
+        extension = next(extension for extension, name in OUTPUT_EXTENSIONS.items() if name == output_format)
+        table = AGGREGATE_TABLES[aggregate] if aggregate is not None else FLAT_TABLE
+        sink = PartitionedSink(path, extension, partial(sink_class, **options), table)
+        return AggregatingSink(sink) if aggregate is not None else sink
+    if normalized:
+        return NormalizedSink(path, partial(sink_class, **options))
+    if aggregate is not None:
+        return AggregatingSink(sink_class(path, AGGREGATE_TABLES[aggregate], **options))
+    return sink_class(path, **options)
+
+
+class LanguageMap(BaseModel):
+    # --language-map file: entries added to (or overriding) LanguageDetector's tables
+    model_config = ConfigDict(extra="forbid")
+
+    extensions: Dict[str, str] = {}
+    filenames: Dict[str, str] = {}
+    interpreters: Dict[str, str] = {}
+
+
+class LanguageDetector:
+    # Classifies a path by its exact file name first, then by its longest known
+    # extension, so "types.d.ts" or "view.blade.php" win over ".ts" or ".php".
+    # With `detect_shebangs`, files neither rule knows are classified by the
+    # interpreter on their "#!" line. Results are memoized per path, and sniffed
+    # ones per blob id, so every distinct file is only looked at once per run.
+    DEFAULT_LANGUAGE = "Other"
+    EXTENSIONS = {
+        ".py": "Python", ".pyw": "Python", ".pyi": "Python", ".pyx": "Python",
+        ".ts": "TypeScript", ".tsx": "TypeScript", ".mts": "TypeScript", ".cts": "TypeScript",
+        ".d.ts": "TypeScript",
+        ".js": "JavaScript", ".jsx": "JavaScript", ".mjs": "JavaScript", ".cjs": "JavaScript",
+        ".java": "Java", ".kt": "Kotlin", ".kts": "Kotlin", ".scala": "Scala", ".sc": "Scala",
+        ".groovy": "Groovy", ".gradle": "Groovy", ".clj": "Clojure", ".cljs": "Clojure",
+        ".cljc": "Clojure", ".edn": "Clojure",
+        ".rb": "Ruby", ".rake": "Ruby", ".gemspec": "Ruby", ".erb": "Ruby", ".html.erb": "HTML+ERB",
+        ".go": "Go", ".rs": "Rust", ".zig": "Zig", ".nim": "Nim",
+        ".c": "C", ".h": "C",
+        ".cpp": "C++", ".cc": "C++", ".cxx": "C++", ".c++": "C++", ".hpp": "C++", ".hh": "C++",
+        ".hxx": "C++", ".ipp": "C++",
+        ".cs": "C#", ".csx": "C#", ".fs": "F#", ".fsi": "F#", ".fsx": "F#", ".vb": "Visual Basic",
+        ".m": "Objective-C", ".mm": "Objective-C++", ".swift": "Swift", ".dart": "Dart",
+        ".php": "PHP", ".phtml": "PHP", ".blade.php": "Blade",
+        ".html": "HTML", ".htm": "HTML", ".xhtml": "HTML",
+        ".css": "CSS", ".scss": "SCSS", ".sass": "Sass", ".less": "Less",
+        ".vue": "Vue", ".svelte": "Svelte",
+        ".json": "JSON", ".jsonc": "JSON", ".json5": "JSON5", ".ipynb": "Jupyter Notebook",
+        ".yml": "YAML", ".yaml": "YAML", ".toml": "TOML", ".ini": "INI", ".cfg": "INI",
+        ".xml": "XML", ".xsd": "XML", ".xsl": "XML", ".svg": "SVG", ".csv": "CSV",
+        ".md": "Markdown", ".markdown": "Markdown", ".mdx": "MDX", ".rst": "reStructuredText",
+        ".txt": "Plain Text",
+        ".sh": "Shell", ".bash": "Shell", ".zsh": "Shell", ".ksh": "Shell", ".fish": "fish",
+        ".ps1": "PowerShell", ".psm1": "PowerShell", ".psd1": "PowerShell",
+        ".bat": "Batchfile", ".cmd": "Batchfile",
+        ".sql": "SQL", ".lua": "Lua", ".pl": "Perl", ".pm": "Perl", ".r": "R", ".jl": "Julia",
+        ".hs": "Haskell", ".ex": "Elixir", ".exs": "Elixir", ".erl": "Erlang", ".hrl": "Erlang",
+        ".ml": "OCaml", ".mli": "OCaml", ".sol": "Solidity", ".asm": "Assembly", ".s": "Assembly",
+        ".f90": "Fortran", ".tf": "HCL", ".tfvars": "HCL", ".hcl": "HCL",
+        ".dockerfile": "Dockerfile", ".mk": "Makefile", ".mak": "Makefile", ".cmake": "CMake",
+        ".proto": "Protocol Buffer", ".graphql": "GraphQL", ".gql": "GraphQL",
+    }
+    # Matched case-insensitively against the file name
+    FILENAMES = {
+        "dockerfile": "Dockerfile", "containerfile": "Dockerfile",
+        "makefile": "Makefile", "gnumakefile": "Makefile", "cmakelists.txt": "CMake",
+        "gemfile": "Ruby", "rakefile": "Ruby", "podfile": "Ruby", "vagrantfile": "Ruby", "brewfile": "Ruby",
+        "jenkinsfile": "Groovy", "build.gradle": "Groovy",
+        "go.mod": "Go Module", "go.sum": "Go Checksums", "requirements.txt": "Pip Requirements",
+        ".bashrc": "Shell", ".bash_profile": "Shell", ".zshrc": "Shell", ".profile": "Shell",
+        ".gitignore": "Ignore List", ".dockerignore": "Ignore List", ".editorconfig": "EditorConfig",
+        "procfile": "Procfile",
+    }
+    # Interpreter on the "#!" line, without a trailing version ("python3.12" -> "python")
+    INTERPRETERS = {
+        "python": "Python", "pypy": "Python", "node": "JavaScript", "nodejs": "JavaScript",
+        "deno": "TypeScript", "ts-node": "TypeScript", "tsx": "TypeScript",
+        "sh": "Shell", "bash": "Shell", "zsh": "Shell", "ksh": "Shell", "dash": "Shell", "ash": "Shell",
+        "fish": "fish", "ruby": "Ruby", "perl": "Perl", "php": "PHP", "rscript": "R", "lua": "Lua",
+        "tclsh": "Tcl", "pwsh": "PowerShell", "awk": "Awk", "gawk": "Awk", "make": "Makefile",
+        "groovy": "Groovy", "swift": "Swift", "kotlin": "Kotlin", "julia": "Julia", "elixir": "Elixir",
+        "escript": "Erlang", "runghc": "Haskell", "runhaskell": "Haskell", "scala": "Scala",
+        "osascript": "AppleScript",
     }
-    __NULL_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+    # Larger blobs are not read just to look at their first line
+    __MAX_SNIFF_SIZE = 1 << 20
 
-    def __init__(self, repo_path: str):
+    def __init__(self, language_map: LanguageMap | None = None, detect_shebangs: bool = False):
+        language_map = language_map or LanguageMap()
+        self.extensions = {
+            extension.lower(): language
+            for extension, language in {**self.EXTENSIONS, **language_map.extensions}.items()
+        }
+        self.filenames = {
+            name.lower(): language for name, language in {**self.FILENAMES, **language_map.filenames}.items()
+        }
+        self.interpreters = {**self.INTERPRETERS, **language_map.interpreters}
+        self.detect_shebangs = detect_shebangs
+        self.__paths: Dict[str, str] = {}
+        self.__blobs: Dict[str, str] = {}
+
+    def detect(self, path: str) -> str:
+        # Language from the path alone. Returns "" when only the file's contents
+        # could tell, which only happens with detect_shebangs.
+        language = self.__paths.get(path)
+        if language is None:
+            language = self.__paths[path] = self.__detect_path(path)
+        return language
+
+    def detect_from_blob(self, repo: Repo, commit: str, path: str) -> str:
+        # For paths detect() could not classify: looks at the "#!" line of the file
+        # as of `commit` (or its first parent, for a deleted file). cat-file's
+        # batch protocol is line-based, so paths with newlines are not sniffed.
+        if "\n" in path:
+            return self.DEFAULT_LANGUAGE
+        for revision in (commit, f"{commit}^"):
+            try:
+                blob_id, object_type, size = repo.git.get_object_header(f"{revision}:{path}")
+                break
+            except ValueError:
+                continue
+        else:
+            return self.DEFAULT_LANGUAGE
+
+        language = self.__blobs.get(blob_id)
+        if language is None:
+            language = self.DEFAULT_LANGUAGE
+            if object_type == b"blob" and size <= self.__MAX_SNIFF_SIZE:
+                # The stream has to be read to the end to keep cat-file in sync
+                _, _, _, stream = repo.git.stream_object_data(blob_id)
+                language = self.__detect_shebang(stream.read().split(b"\n", 1)[0])
+            self.__blobs[blob_id] = language
+        return language
+
+    def __detect_path(self, path: str) -> str:
+        name = path.rsplit("/", 1)[-1].lower()
+        language = self.filenames.get(name)
+        if language is not None:
+            return language
+
+        # Try every suffix starting at a dot, longest first; a leading dot marks a
+        # hidden file, not an extension
+        index = name.find(".", 1)
+        while index != -1:
+            language = self.extensions.get(name[index:])
+            if language is not None:
+                return language
+            index = name.find(".", index + 1)
+        return "" if self.detect_shebangs else self.DEFAULT_LANGUAGE
+
+    def __detect_shebang(self, first_line: bytes) -> str:
+        if not first_line.startswith(b"#!"):
+            return self.DEFAULT_LANGUAGE
+        words = first_line[2:].decode("utf-8", "replace").split()
+        if words and os.path.basename(words[0]) == "env":
+            # "#!/usr/bin/env -S VAR=1 python3 -u": skip env's options and assignments
+            words = [word for word in words[1:] if not word.startswith("-") and "=" not in word]
+        if not words:
+            return self.DEFAULT_LANGUAGE
+        interpreter = os.path.basename(words[0]).lower().rstrip("0123456789.")
+        return self.interpreters.get(interpreter, self.DEFAULT_LANGUAGE)
+
+
+class PathFilter:
+    # --include/--exclude globs and .gitattributes rules, turned into git pathspecs
+    # so filtered-out files are left out by `git diff-tree` itself and never diffed
+    LINGUIST_ATTRIBUTES = ["linguist-generated", "linguist-vendored"]
+
+    def __init__(
+        self, include: List[str] | None = None, exclude: List[str] | None = None, exclude_generated: bool = False
+    ):
+        for pattern in [*(include or []), *(exclude or [])]:
+            if not pattern.strip().strip("/"):
+                raise ValueError(f"Invalid path pattern: {pattern!r}")
+        self.include = include or []
+        self.exclude = exclude or []
+        self.exclude_generated = exclude_generated
+
+    def __bool__(self) -> bool:
+        return bool(self.include or self.exclude or self.exclude_generated)
+
+    def pathspecs(self) -> List[str]:
+        pathspecs = [f":(glob){glob}" for pattern in self.include for glob in self.__globs(pattern)]
+        pathspecs += [f":(exclude,glob){glob}" for pattern in self.exclude for glob in self.__globs(pattern)]
+        if self.exclude_generated:
+            # "linguist-generated" and "linguist-generated=true" are both common
+            for attribute in self.LINGUIST_ATTRIBUTES:
+                pathspecs += [f":(exclude,attr:{attribute})", f":(exclude,attr:{attribute}=true)"]
+        return pathspecs
+
+    def __globs(self, pattern: str) -> List[str]:
+        # .gitignore-style: without a slash the pattern matches at any depth, a
+        # leading slash anchors it at the root, and a matched directory takes
+        # everything below it along (glob pathspecs only match whole paths)
+        pattern = pattern.strip().rstrip("/")
+        if pattern.startswith("/"):
+            pattern = pattern.lstrip("/")
+        elif "/" not in pattern:
+            pattern = f"**/{pattern}"
+        return [pattern, f"{pattern}/**"]
+
+    def linguist_attributes(self, repo: Repo) -> str:
+        # The linguist rules of every .gitattributes at HEAD, rewritten relative to
+        # the root so they can be used as a single attributes file
+        if not self.exclude_generated:
+            return ""
+        try:
+            paths = repo.git.ls_tree("-r", "-z", "--name-only", "HEAD").split("\0")
+        except GitCommandError:
+            # Empty repository
+            return ""
+
+        lines: List[str] = []
+        # Deeper files take precedence, and later lines in a file win
+        for path in sorted(
+            (path for path in paths if os.path.basename(path) == ".gitattributes"),
+            key=lambda path: (path.count("/"), path),
+        ):
+            directory = os.path.dirname(path)
+            for line in repo.git.show(f"HEAD:{path}").splitlines():
+                fields = line.split()
+                if not fields or fields[0].startswith(("#", "[attr]")):
+                    continue
+                attributes = [
+                    field for field in fields[1:]
+                    if field.lstrip("-!").split("=", 1)[0] in self.LINGUIST_ATTRIBUTES
+                ]
+                if not attributes:
+                    continue
+                pattern = fields[0]
+                if directory:
+                    # Patterns with a slash other than a trailing one are relative to the
+                    # file's directory; the others match at any depth below it
+                    if "/" in pattern.rstrip("/"):
+                        pattern = f"{directory}/{pattern.lstrip('/')}"
+                    else:
+                        pattern = f"{directory}/**/{pattern}"
+                lines.append(" ".join([pattern, *attributes]))
+        return "".join(f"{line}\n" for line in lines)
+
+
+class GitRepoConsumer:
+    # One NUL-terminated header per commit
+    __LOG_FORMAT = "%H%x00%P%x00%ct%x00%ae"
+    __LOG_HEADER_SIZE = 4
+    __READ_SIZE = 1 << 16
+    __BATCHES_PER_WORKER = 4
+    __MAX_BATCH_SIZE = 1000
+
+    def __init__(
+        self,
+        repo_path: str,
+        diff_workers: int = 1,
+        metrics_cache: MetricsCache | None = None,
+        language_detector: LanguageDetector | None = None,
+        path_filter: PathFilter | None = None,
+    ):
         self.repo_path = repo_path
         self.repo = Repo(self.repo_path)
+        self.repository = os.path.basename(os.path.normpath(self.repo_path))
+        self.diff_workers = diff_workers
+        self.metrics_cache = metrics_cache
+        self.language_detector = language_detector or LanguageDetector()
+        self.path_filter = path_filter or PathFilter()
+
+        self.__pathspecs = self.path_filter.pathspecs()
+        # Remote that missing blobs of a partial clone (--filter-blobs) come from. Older
+        # git versions name it in extensions.partialClone.
+        promisors = self.repo.git.config(
+            "--get-regexp", r"^remote\..*\.promisor$", "^true$", with_exceptions=False
+        ).split()
+        self.__promisor_remote = (
+            promisors[0][len("remote."):-len(".promisor")] if promisors
+            else self.repo.git.config("--get", "extensions.partialClone", with_exceptions=False)
+        )
+        self.__cache_scope = ""
+        self.__attributes_file: str | None = None
+        if self.path_filter:
+            attributes = self.path_filter.linguist_attributes(self.repo)
+            if self.path_filter.exclude_generated and not self.repo.bare:
+                # git would read .gitattributes from the work tree, which may not match
+                # HEAD. Run it from inside the git directory, where it reads them from
+                # core.attributesFile like it does for bare repositories.
+                self.repo.git = Git(self.repo.git_dir)
+            if attributes:
+                fd, self.__attributes_file = tempfile.mkstemp(prefix="canaicode-attributes-")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(attributes)
+                self.repo.git.set_persistent_git_options(c=f"core.attributesFile={self.__attributes_file}")
+            # The same filters (and .gitattributes rules) give the same numstat
+            self.__cache_scope = hashlib.sha256(
+                "\0".join([*self.__pathspecs, attributes]).encode("utf-8")
+            ).hexdigest()[:16]
+
+    def close(self) -> None:
+        # Also stops the cat-file processes shebang detection may have started
+        self.repo.close()
+        if self.__attributes_file is not None:
+            os.remove(self.__attributes_file)
+            self.__attributes_file = None
 
     def get_commits_by_date(self, date: date) -> List[CommitMetrics]:
-        result: List[CommitMetrics] = []
+        return self.get_commits_in_range(date, date)
 
-        for commit in self.repo.iter_commits("--all"):
-            commit_date = datetime.fromtimestamp(commit.committed_date).date()
-            if commit_date != date:
-                continue
+    def get_commits_in_range(
+        self, start: date, end: date, exclude: List[str] | None = None
+    ) -> List[CommitMetrics]:
+        rows = [row._asdict() for rows in self.__iter_commit_rows(start, end, exclude) for row in rows]
+        return COMMIT_METRICS_LIST.validate_python(rows)
 
-            if not commit.parents:
-                diff = self.repo.git.diff(self.__NULL_TREE, commit.hexsha, "--numstat")
-            else:
-                diff = self.repo.git.diff(
-                    commit.parents[0].hexsha, commit.hexsha, "--numstat"
+    def get_rows_in_range(
+        self, start: date, end: date, exclude: List[str] | None = None
+    ) -> List[CommitRow]:
+        # Unvalidated rows, for callers that write them out directly
+        return [row for rows in self.__iter_commit_rows(start, end, exclude) for row in rows]
+
+    def get_frame_in_range(
+        self, start: date, end: date, exclude: List[str] | None = None
+    ) -> pd.DataFrame:
+        # Same rows as a DataFrame with categorical repository/author/language columns
+        columns = CommitColumns()
+        for rows in self.__iter_commit_rows(start, end, exclude):
+            columns.append(rows)
+        return columns.to_frame()
+
+    def export_commits_in_range(
+        self, start: date, end: date, sink: RowSink, exclude: List[str] | None = None
+    ) -> int:
+        # Rows go to the sink one commit at a time, so memory does not grow with
+        # the number of rows. Returns the number of rows written.
+        sink.open_repository(self.repository)
+        written = 0
+        for rows in self.__iter_commit_rows(start, end, exclude):
+            sink.write(rows)
+            written += len(rows)
+        return written
+
+    def get_ref_tips(self) -> Dict[str, str]:
+        # Commit each ref (and HEAD) points to, with annotated tags peeled
+        tips: Dict[str, str] = {}
+        refs = self.repo.git.for_each_ref("--format=%(refname)%00%(objectname)%00%(*objectname)")
+        for line in refs.splitlines():
+            refname, objectname, peeled = line.split("\0")
+            tips[refname] = peeled or objectname
+        try:
+            tips["HEAD"] = self.repo.git.rev_parse("--verify", "--quiet", "HEAD^{commit}")
+        except GitCommandError:
+            pass
+        return tips
+
+    def __iter_commit_rows(
+        self, start: date, end: date, exclude: List[str] | None
+    ) -> Iterator[List[CommitRow]]:
+        # Commits reachable from any sha in `exclude` are skipped (`git log --all ^sha`),
+        # which is how incremental runs only look at history added since a checkpoint
+        exclude = self.__existing_commits(exclude) if exclude else []
+        repository = self.repository
+        detect = self.language_detector.detect
+        detect_from_blob = self.language_detector.detect_from_blob
+
+        # All rows of a day share one datetime object
+        day: date | None = None
+        day_start = datetime.min
+        for hexsha, commit_date, author, changes in self.__iter_commit_changes(start, end, exclude):
+            if commit_date != day:
+                day = commit_date
+                day_start = datetime.combine(commit_date, time.min)
+            yield [
+                CommitRow(
+                    hexsha, repository, day_start, author,
+                    detect(filename) or detect_from_blob(self.repo, hexsha, filename),
+                    added, removed,
                 )
+                for added, removed, filename in changes
+            ]
+
+    def __existing_commits(self, shas: List[str]) -> List[str]:
+        # Old checkpoints may name commits that were force-pushed away, garbage
+        # collected or cut off by a shallow clone; git log refuses those
+        process = self.repo.git.cat_file("--batch-check", as_process=True, istream=subprocess.PIPE)
+        output, _ = process.communicate("".join(f"{sha}\n" for sha in shas).encode())
+        return [
+            fields[0]
+            for fields in (line.split() for line in output.decode().splitlines())
+            if len(fields) == 3 and fields[1] == "commit"
+        ]
+
+    def __iter_commit_changes(
+        self, start: date, end: date, exclude: List[str]
+    ) -> Iterator[Tuple[str, date, str, Numstat]]:
+        # Commits are listed first (cheap: no diffs) and put in output order, days
+        # ascending and walk order within a day. Their numstat is then streamed in
+        # batches in that same order, so rows never have to be buffered and sorted.
+        commits = self.__list_commits(start, end, exclude)
+        commits.sort(key=lambda commit: commit[2])
+
+        batch_size = -(-len(commits) // (self.diff_workers * self.__BATCHES_PER_WORKER))
+        batch_size = min(max(batch_size, 1), self.__MAX_BATCH_SIZE)
+        batches = [commits[i:i + batch_size] for i in range(0, len(commits), batch_size)]
+
+        for batch, changes_by_key in zip(batches, self.__iter_batch_changes(batches)):
+            for hexsha, first_parent, commit_date, author in batch:
+                yield hexsha, commit_date, author, changes_by_key[(hexsha, first_parent)]
+
+    def __list_commits(self, start: date, end: date, exclude: List[str]) -> List[Tuple[str, str, date, str]]:
+        # Let git drop commits outside the window (and stop walking once it is past
+        # the start) so old history is never loaded. Bounds are local-time days,
+        # matching how commit dates are bucketed.
+        since = int(datetime.combine(start, time.min).timestamp())
+        until = int(datetime.combine(end + timedelta(days=1), time.min).timestamp()) - 1
+
+        # Excluded commits go through stdin; there can be one per ref
+        process = self.repo.git.log(
+            "--all", f"--since=@{since}", f"--until=@{until}", "-z", f"--format={self.__LOG_FORMAT}", "--stdin",
+            as_process=True,
+            istream=subprocess.PIPE,
+        )
+        with process.stdin:
+            process.stdin.write("".join(f"^{sha}\n" for sha in exclude).encode())
+
+        commits: List[Tuple[str, str, date, str]] = []
+        headers = (header for header, _ in self.__parse_numstat(process.stdout, self.__LOG_HEADER_SIZE))
+        for hexsha, parents, committed_date, author in headers:
+            commit_date = datetime.fromtimestamp(int(committed_date)).date()
+            if start <= commit_date <= end:
+                commits.append((hexsha, parents.split(" ", 1)[0], commit_date, author))
+        process.wait()
+        return commits
+
+    def __iter_batch_changes(
+        self, batches: List[List[Tuple[str, str, date, str]]]
+    ) -> Iterator[Dict[Tuple[str, str], Numstat]]:
+        # The metrics cache's SQLite connection belongs to this thread, so lookups
+        # and stores happen here and diff workers only see the misses
+        if self.diff_workers <= 1:
+            for batch in batches:
+                cached, missing = self.__cached_changes(batch)
+                yield self.__store_changes(cached, missing, self.__diff_batch(missing) if missing else {})
+            return
+
+        # Several `git diff-tree` processes work on consecutive batches; results are
+        # yielded in batch order and only a few batches are in flight at a time
+        with ThreadPoolExecutor(max_workers=self.diff_workers) as executor:
+            pending: Deque[Tuple[Dict[Tuple[str, str], Numstat], List[Tuple[str, str]], Future | None]] = deque()
+
+            def submit(batch: List[Tuple[str, str, date, str]]) -> None:
+                cached, missing = self.__cached_changes(batch)
+                future = executor.submit(self.__diff_batch, missing) if missing else None
+                pending.append((cached, missing, future))
+
+            for batch in batches[:self.diff_workers * 2]:
+                submit(batch)
+            remaining = iter(batches[self.diff_workers * 2:])
+            while pending:
+                cached, missing, future = pending.popleft()
+                yield self.__store_changes(cached, missing, future.result() if future is not None else {})
+                batch = next(remaining, None)
+                if batch is not None:
+                    submit(batch)
+
+    def __cached_changes(
+        self, batch: List[Tuple[str, str, date, str]]
+    ) -> Tuple[Dict[Tuple[str, str], Numstat], List[Tuple[str, str]]]:
+        # Numstat the metrics cache has, and the keys that still need diffing
+        keys = [(hexsha, first_parent) for hexsha, first_parent, _, _ in batch]
+        cached = self.metrics_cache.get_many(keys, self.__cache_scope) if self.metrics_cache is not None else {}
+        return cached, [key for key in keys if key not in cached]
+
+    def __store_changes(
+        self,
+        cached: Dict[Tuple[str, str], Numstat],
+        missing: List[Tuple[str, str]],
+        diffed: Dict[str, Numstat],
+    ) -> Dict[Tuple[str, str], Numstat]:
+        computed = {key: diffed.get(key[0], []) for key in missing}
+        if computed and self.metrics_cache is not None:
+            self.metrics_cache.put_many(computed, self.__cache_scope)
+        cached.update(computed)
+        return cached
 
-            author: str | None = commit.author.email
+    def __diff_batch(self, commits: List[Tuple[str, str]]) -> Dict[str, Numstat]:
+        # Each stdin line is "<commit> <first parent>" (or just "<commit>" for roots),
+        # so merges are diffed against their first parent and root commits against
+        # the empty tree. -M matches the rename detection `git diff` applies by default.
+        # Files the path filter leaves out are skipped by git before any diffing.
+        if self.__promisor_remote:
+            self.__prefetch_blobs(commits)
+        process = self.repo.git.diff_tree(
+            "--stdin", "-z", "-r", "--numstat", "--root", "-M", "--", *self.__pathspecs,
+            as_process=True,
+            istream=subprocess.PIPE,
+        )
 
-            for line in diff.splitlines():
-                parts = line.strip().split("\t")
-                if len(parts) != 3:
+        def feed() -> None:
+            with process.stdin:
+                for hexsha, first_parent in commits:
+                    line = f"{hexsha} {first_parent}" if first_parent else hexsha
+                    process.stdin.write(f"{line}\n".encode())
+
+        writer = threading.Thread(target=feed, daemon=True)
+        writer.start()
+        changes_by_commit = {header[0]: changes for header, changes in self.__parse_numstat(process.stdout, 1)}
+        writer.join()
+        process.wait()
+        return changes_by_commit
+
+    def __prefetch_blobs(self, commits: List[Tuple[str, str]]) -> None:
+        # A partial clone fetches every missing blob the diff needs with a request of
+        # its own. A raw diff only compares trees, so it lists the batch's blobs
+        # without reading them, and they are then fetched in one request.
+        lines = "".join(
+            f"{hexsha} {first_parent}\n" if first_parent else f"{hexsha}\n" for hexsha, first_parent in commits
+        )
+        process = self.repo.git.diff_tree(
+            "--stdin", "-z", "-r", "--raw", "--root", "--no-renames", "--", *self.__pathspecs,
+            as_process=True,
+            istream=subprocess.PIPE,
+        )
+        output, _ = process.communicate(lines.encode())
+
+        blobs = set()
+        for token in output.split(b"\0"):
+            # ":<old mode> <new mode> <old blob> <new blob> <status>"; gitlinks are not blobs
+            if token.startswith(b":"):
+                old_mode, new_mode, old_blob, new_blob = token[1:].decode().split(" ")[:4]
+                if old_mode not in ("000000", "160000"):
+                    blobs.add(old_blob)
+                if new_mode not in ("000000", "160000"):
+                    blobs.add(new_blob)
+        if blobs:
+            # The request git makes for a single missing object. Should it fail, the
+            # diff still fetches whatever is missing on its own.
+            fetch = Git(self.repo.git_dir)(c="fetch.negotiationAlgorithm=noop").fetch(
+                self.__promisor_remote, "--no-tags", "--no-write-fetch-head", "--recurse-submodules=no",
+                "--filter=blob:none", "--stdin",
+                as_process=True,
+                istream=subprocess.PIPE,
+            )
+            fetch.communicate("".join(f"{blob}\n" for blob in sorted(blobs)).encode())
+
+    def __parse_numstat(self, stream: BinaryIO, header_size: int) -> Iterator[Tuple[List[str], Numstat]]:
+        # Records are `header_size` NUL-separated header fields followed by numstat
+        # entries "added\tremoved\tpath". Renames are "added\tremoved\t\0old\0new";
+        # they are classified by the new path. Binary files ("-") count as 0 lines.
+        header: List[str] = []
+        changes: Numstat = []
+        rename: Tuple[int, int] | None = None
+        rename_old_path_seen = False
+        # The same counts and paths come up again and again within a block, so each
+        # distinct one is converted once (this also shares the path strings)
+        counts: Dict[bytes, int] = {b"-": 0}
+        paths: Dict[bytes, str] = {}
+
+        # Tokens are handled a whole read block at a time, without a generator
+        # step per token
+        for tokens in self.__iter_token_blocks(stream):
+            for token in tokens:
+                if rename is not None:
+                    if not rename_old_path_seen:
+                        rename_old_path_seen = True
+                        continue
+                    path = paths.get(token)
+                    if path is None:
+                        path = paths[token] = token.decode("utf-8", "surrogateescape")
+                    changes.append((rename[0], rename[1], path))
+                    rename = None
+                    rename_old_path_seen = False
                     continue
 
-                added, removed, filename = parts
-                if added == "-":
-                    added = 0
-                if removed == "-":
-                    removed = 0
-
-                language = self.__get_language(filename)
-                result.append(
-                    CommitMetrics(
-                        added_lines=int(added),
-                        author=author,
-                        date=datetime.combine(commit_date, time.min),
-                        hash=commit.hexsha,
-                        language=language,
-                        removed_lines=int(removed),
-                        repository=os.path.basename(os.path.normpath(self.repo_path)),
-                    )
-                )
-        return result
+                if len(header) < header_size:
+                    header.append(token.decode("utf-8", "replace"))
+                    continue
+
+                fields = token.split(b"\t", 2)
+                if len(fields) == 3:
+                    added_field, removed_field, path_field = fields
+                    added = counts.get(added_field)
+                    if added is None:
+                        added = counts[added_field] = int(added_field)
+                    removed = counts.get(removed_field)
+                    if removed is None:
+                        removed = counts[removed_field] = int(removed_field)
+                    if path_field:
+                        path = paths.get(path_field)
+                        if path is None:
+                            path = paths[path_field] = path_field.decode("utf-8", "surrogateescape")
+                        changes.append((added, removed, path))
+                    else:
+                        rename = (added, removed)
+                    continue
+
+                # Anything else starts the next record
+                yield header, changes
+                header = [token.decode("utf-8", "replace")]
+                changes = []
+
+        if len(header) == header_size:
+            yield header, changes
+
+    def __iter_token_blocks(self, stream: BinaryIO) -> Iterator[List[bytes]]:
+        remainder = b""
+        while True:
+            chunk = stream.read(self.__READ_SIZE)
+            if not chunk:
+                break
+            tokens = (remainder + chunk).split(b"\0")
+            remainder = tokens.pop()
+            yield tokens
+        if remainder:
+            yield [remainder]
+
+
+class CloneCache:
+    # Bare mirrors live under <cache_dir>/<url key>/<repo name> so the repository
+    # name seen by GitRepoConsumer is the same as for a fresh clone
+    __FETCH_REFSPEC = "+refs/heads/*:refs/heads/*"
+
+    def __init__(self, cache_dir: str, max_bytes: int, filter_blobs: bool = False):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.filter_blobs = filter_blobs
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get(self, url: str, verbose: bool = False) -> str:
+        entry_dir = os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest()[:16])
+        repo_name = os.path.splitext(os.path.basename(url.rstrip("/")))[0]
+        repo_path = os.path.join(entry_dir, repo_name)
+
+        if os.path.isdir(repo_path):
+            if verbose:
+                print(f"Fetching {url} into cached mirror {repo_path}...")
+            Repo(repo_path).git.fetch("--prune", "--tags", "origin")
+        else:
+            if verbose:
+                print(f"Cloning {url} into cache {repo_path}...")
+            # Clone next to the final location and move it into place once complete,
+            # so an interrupted clone never looks like a valid cache entry
+            os.makedirs(entry_dir, exist_ok=True)
+            staging_dir = tempfile.mkdtemp(dir=entry_dir)
+            try:
+                clone_repository(url, os.path.join(staging_dir, repo_name), filter_blobs=self.filter_blobs)
+                repo = Repo(os.path.join(staging_dir, repo_name))
+                repo.git.config("remote.origin.fetch", self.__FETCH_REFSPEC)
+                os.rename(os.path.join(staging_dir, repo_name), repo_path)
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+        # The entry directory's mtime is the LRU timestamp
+        os.utime(entry_dir)
+        return repo_path
+
+    def evict(self, keep_since: float, verbose: bool = False) -> None:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if os.path.isdir(entry_dir):
+                entries.append((os.path.getmtime(entry_dir), self.__dir_size(entry_dir), entry_dir))
+
+        total = sum(size for _, size, _ in entries)
+        for last_used, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Mirrors used by the current run are never evicted
+            if last_used >= keep_since:
+                continue
+            if verbose:
+                print(f"Evicting cached mirror {entry_dir} ({size} bytes)")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
 
-    def __get_language(self, filename: str) -> str:
-        _, ext = os.path.splitext(filename)
-        return self.__EXT_TO_LANG.get(ext, self.__DEFAULT_LANG)
+    def __dir_size(self, path: str) -> int:
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
 
 
 def parse_date(input_str: str) -> date:
@@ -89,35 +1526,198 @@ def parse_date(input_str: str) -> date:
         raise ValueError("Invalid date. Use the format YYYY-MM-DD.")
 
 
-def process_repository(repo_input: str, start_date: date, end_date: date, verbose: bool = False) -> List[CommitMetrics]:
-    # Check if input is a local path or a URL
+def parse_size(input_str: str) -> int:
+    units = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    value = input_str.strip().upper().removesuffix("B")
+    unit = value[-1:] if value[-1:] in units else ""
+    try:
+        return int(float(value[:len(value) - len(unit)]) * units[unit])
+    except ValueError:
+        raise ValueError(f"Invalid size: {input_str}. Use a number with an optional K, M, G or T suffix.")
+
+
+def remote_fingerprint(url: str) -> str:
+    # Hash of the branch and tag tips a clone would see; it changes whenever a push does
+    refs = Git().ls_remote("--heads", "--tags", url)
+    return hashlib.sha256("\n".join(sorted(refs.splitlines())).encode("utf-8")).hexdigest()
+
+
+def clone_repository(url: str, repo_path: str, shallow_since: date | None = None, filter_blobs: bool = False) -> bool:
+    # Returns False when a shallow clone finds nothing as recent as `shallow_since`.
+    # Only history is needed, so the clone is always bare.
+    options: Dict[str, str | bool] = {"bare": True}
+    if filter_blobs:
+        # Blobs are fetched lazily, and only for the commits that actually get diffed
+        options["filter"] = "blob:none"
+    if shallow_since is not None:
+        # Start a day early so time zones can't push window commits past the boundary
+        boundary = datetime.combine(shallow_since - timedelta(days=1), time.min)
+        options["shallow_since"] = f"@{int(boundary.timestamp())}"
+        # Shallow clones default to a single branch; the walk needs them all
+        options["no_single_branch"] = True
+
+    try:
+        repo = Repo.clone_from(url, repo_path, **options)
+    except GitCommandError as e:
+        if shallow_since is not None and "no commits selected for shallow requests" in str(e.stderr):
+            return False
+        raise
+
+    if shallow_since is not None:
+        deepen_shallow_boundary(repo, shallow_since)
+    return True
+
+
+def deepen_shallow_boundary(repo: Repo, window_start: date) -> None:
+    # A commit on the shallow boundary looks like a root commit and would be diffed
+    # against the empty tree. Deepen until no boundary commit is inside the window,
+    # so every commit that gets diffed has its first parent's tree available.
+    window_start_ts = int(datetime.combine(window_start, time.min).timestamp())
+    shallow_file = os.path.join(repo.git_dir, "shallow")
+
+    while os.path.isfile(shallow_file):
+        with open(shallow_file, "r", encoding="utf-8") as f:
+            boundary = f.read().split()
+
+        # --shallow-since can list a commit as shallow without sending it (the second
+        # parent of a merge whose first parent is past the cutoff), and git then refuses
+        # to deepen. Dropping it from the list makes the next deepen fetch it.
+        present = repo.git.rev_list("--no-walk", "--ignore-missing", *boundary).split()
+        if len(present) < len(boundary):
+            with open(shallow_file, "w", encoding="utf-8") as f:
+                f.writelines(f"{sha}\n" for sha in boundary if sha in present)
+        else:
+            committed_dates = repo.git.log("--no-walk", "--format=%ct", *boundary).split()
+            if all(int(committed_date) < window_start_ts for committed_date in committed_dates):
+                return
+        repo.git.fetch("--deepen=1", "origin", "+refs/heads/*:refs/heads/*")
+
+
+def extract_commits(
+    repo_path: str,
+    start_date: date,
+    end_date: date,
+    verbose: bool = False,
+    diff_workers: int = 1,
+    metrics_cache: MetricsCache | None = None,
+    checkpoint: RepositoryCheckpoint | None = None,
+    fingerprint: str | None = None,
+    sink: RowSink | None = None,
+    language_detector: LanguageDetector | None = None,
+    path_filter: PathFilter | None = None,
+) -> RepositoryResult:
+    # With a sink, rows are streamed into it and the result carries no rows
+    repo_name = os.path.basename(os.path.normpath(repo_path))
+    consumer = GitRepoConsumer(repo_path, diff_workers, metrics_cache, language_detector, path_filter)
+
+    # Skip history reachable from the previous run's tips, as long as that run
+    # already covered every old commit this window could contain
+    exclude: List[str] = []
+    if checkpoint is not None and checkpoint.covers(start_date, end_date):
+        exclude = sorted(set(checkpoint.refs.values()))
+    elif checkpoint is not None and verbose:
+        print(f"Checkpoint for {repo_name} does not cover {start_date} to {end_date}, walking the full window")
+
+    if verbose:
+        mode = "new commits" if exclude else "commits"
+        print(f"Fetching {mode} from {repo_name} between {start_date} and {end_date}...")
+
+    hits, misses = (metrics_cache.hits, metrics_cache.misses) if metrics_cache is not None else (0, 0)
+    rows_before = sink.rows_written if sink is not None else 0
+    try:
+        tips = consumer.get_ref_tips()
+        if sink is not None:
+            rows: List[CommitRow] = []
+            consumer.export_commits_in_range(start_date, end_date, sink, exclude)
+        else:
+            rows = consumer.get_rows_in_range(start_date, end_date, exclude)
+    except Exception as e:
+        if sink is not None and sink.rows_written > rows_before:
+            raise PartialExportError(
+                f"{repo_name} failed after {sink.rows_written - rows_before} of its rows were written: {e}"
+            ) from e
+        raise
+    finally:
+        consumer.close()
+    if verbose and metrics_cache is not None:
+        print(
+            f"Metrics cache for {repo_name}: {metrics_cache.hits - hits} hits, "
+            f"{metrics_cache.misses - misses} misses"
+        )
+
+    return RepositoryResult(
+        repository=repo_name,
+        rows=rows,
+        checkpoint=RepositoryCheckpoint(
+            refs=tips, start=start_date, end=end_date, extracted_on=date.today(), fingerprint=fingerprint
+        ),
+    )
+
+
+def process_repository(
+    repo_input: str,
+    start_date: date,
+    end_date: date,
+    verbose: bool = False,
+    diff_workers: int = 1,
+    clone_cache: CloneCache | None = None,
+    shallow_clone: bool = False,
+    filter_blobs: bool = False,
+    metrics_cache: MetricsCache | None = None,
+    checkpoint: RepositoryCheckpoint | None = None,
+    skip_unchanged: bool = False,
+    sink: RowSink | None = None,
+    language_detector: LanguageDetector | None = None,
+    path_filter: PathFilter | None = None,
+) -> RepositoryResult | None:
+    # Returns None when the repository could not be processed
     is_local_path = os.path.isdir(repo_input)
 
+    fingerprint: str | None = None
+    if skip_unchanged and not is_local_path:
+        # Nothing was pushed since the checkpoint, so the window holds no new commits
+        repo_name = os.path.splitext(os.path.basename(repo_input.rstrip("/")))[0]
+        fingerprint = remote_fingerprint(repo_input)
+        if (
+            checkpoint is not None
+            and checkpoint.fingerprint == fingerprint
+            and checkpoint.covers(start_date, end_date)
+        ):
+            if verbose:
+                print(f"Skipping {repo_input}: no refs changed since {checkpoint.extracted_on}")
+            return RepositoryResult(repository=repo_name, rows=[], checkpoint=checkpoint, skipped=True)
+
+    extract = partial(
+        extract_commits,
+        start_date=start_date,
+        end_date=end_date,
+        verbose=verbose,
+        diff_workers=diff_workers,
+        metrics_cache=metrics_cache,
+        checkpoint=checkpoint,
+        fingerprint=fingerprint,
+        sink=sink,
+        language_detector=language_detector,
+        path_filter=path_filter,
+    )
+
     if is_local_path:
         # Use local repository directly
         repo_path = os.path.abspath(repo_input)
-        repo_name = os.path.basename(os.path.normpath(repo_path))
-        temp_dir = None
 
         if verbose:
             print(f"Using local repository: {repo_path}")
 
         try:
-            consumer = GitRepoConsumer(repo_path)
-            all_commits: List[CommitMetrics] = []
-
-            current_date = start_date
-            while current_date <= end_date:
-                if verbose:
-                    print(f"Fetching commits from {repo_name} on {current_date}...")
-                commits = consumer.get_commits_by_date(current_date)
-                all_commits.extend(commits)
-                current_date += timedelta(days=1)
-
-            return all_commits
+            return extract(repo_path)
+        except PartialExportError:
+            raise
         except Exception as e:
             print(f"Error processing local repository {repo_path}: {e}")
-            return []
+            return None
+    elif clone_cache is not None:
+        # Reuse a persistent bare mirror, fetching only what changed since the last run
+        return extract(clone_cache.get(repo_input, verbose))
     else:
         # Clone remote repository
         temp_dir = tempfile.mkdtemp()
@@ -127,27 +1727,82 @@ def process_repository(repo_input: str, start_date: date, end_date: date, verbos
         try:
             if verbose:
                 print(f"Cloning {repo_input}...")
-            Repo.clone_from(repo_input, repo_path)
-
-            consumer = GitRepoConsumer(repo_path)
-            all_commits: List[CommitMetrics] = []
-
-            current_date = start_date
-            while current_date <= end_date:
+            if not clone_repository(repo_input, repo_path, start_date if shallow_clone else None, filter_blobs):
                 if verbose:
-                    print(f"Fetching commits from {repo_name} on {current_date}...")
-                commits = consumer.get_commits_by_date(current_date)
-                all_commits.extend(commits)
-                current_date += timedelta(days=1)
+                    print(f"No commits in {repo_name} since {start_date}")
+                return RepositoryResult(repository=repo_name, rows=[], checkpoint=checkpoint)
 
-            return all_commits
+            return extract(repo_path)
         finally:
             shutil.rmtree(temp_dir, ignore_errors=True)
 
 
+def process_repositories(
+    repo_inputs: List[str],
+    start_date: date,
+    end_date: date,
+    jobs: int = 1,
+    checkpoints: Dict[str, RepositoryCheckpoint] | None = None,
+    sink: RowSink | None = None,
+    **options: Any,
+) -> Iterator[Tuple[str, RepositoryResult | None]]:
+    # Yields (input, result) pairs in input order, so merging stays deterministic.
+    # `options` are passed through to process_repository; a failed repository
+    # yields None and does not stop the others, unless some of its rows already
+    # reached the sink (PartialExportError). With a sink, every repository's
+    # rows are written into it in input order.
+    extract = partial(process_repository, start_date=start_date, end_date=end_date, **options)
+    checkpoints = checkpoints or {}
+
+    if jobs <= 1:
+        for repo_input in repo_inputs:
+            try:
+                yield repo_input, extract(repo_input, checkpoint=checkpoints.get(repo_input), sink=sink)
+            except PartialExportError:
+                raise
+            except Exception as e:
+                print(f"Error processing repository {repo_input}: {e}")
+                yield repo_input, None
+        return
+
+    # Keep only a small window of repositories in flight so finished results
+    # don't pile up in memory while an earlier, slower repository is still running
+    window = jobs * 2
+    inputs = iter(repo_inputs)
+    pending: Deque[Tuple[str, Future]] = deque()
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        def submit(repo_input: str) -> None:
+            future = executor.submit(extract, repo_input, checkpoint=checkpoints.get(repo_input))
+            pending.append((repo_input, future))
+
+        for repo_input in islice(inputs, window):
+            submit(repo_input)
+
+        while pending:
+            repo_input, future = pending.popleft()
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error processing repository {repo_input}: {e}")
+                result = None
+
+            # Workers can't share the sink, so their rows are written here, one
+            # repository at a time
+            if sink is not None and result is not None and result.rows:
+                sink.open_repository(result.repository)
+                sink.write(result.rows)
+                result.rows = []
+            yield repo_input, result
+
+            next_input = next(inputs, None)
+            if next_input is not None:
+                submit(next_input)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
-        description="Extract Git commits from repositories and export to Excel",
+        description="Extract Git commits from repositories and export per-file metrics",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
@@ -158,6 +1813,45 @@ Examples:
   # Multiple repositories from file
   %(prog)s --file repos.txt --start 2024-01-01 --end 2024-12-31
   %(prog)s -f repos.txt -s 2024-01-01 -e 2024-12-31
+
+  # Extract 8 repositories at a time
+  %(prog)s -f repos.txt -s 2024-01-01 -e 2024-12-31 --jobs 8
+
+  # Diff a large repository with 4 concurrent git processes
+  %(prog)s /path/to/monorepo -s 2024-01-01 -e 2024-12-31 --diff-workers 4
+
+  # Keep mirrors of remote repositories between runs (fetch instead of clone)
+  %(prog)s -f repos.txt -s 2024-01-01 -e 2024-12-31 --cache-dir ~/.cache/canaicode --cache-max-size 20G
+
+  # Clone only the history needed for the date range
+  %(prog)s https://github.com/user/repo.git -s 2024-06-01 -e 2024-06-30 --shallow-clone --filter-blobs
+
+  # Reuse per-commit metrics from earlier runs
+  %(prog)s -f repos.txt -s 2024-01-01 -e 2024-12-31 --metrics-cache ~/.cache/canaicode/metrics.db
+
+  # Only extract commits pushed since the previous run
+  %(prog)s -f repos.txt -s 2024-01-01 -e 2024-12-31 --state-file extractor-state.json
+
+  # Stream rows to CSV or Parquet instead of Excel
+  %(prog)s -f repos.txt -s 2024-01-01 -e 2024-12-31 -o commits.parquet
+
+  # Commits and their file changes as two joinable Parquet files
+  %(prog)s -f repos.txt -s 2024-01-01 -e 2024-12-31 --format parquet --normalize
+
+  # Daily totals per author and language instead of one row per file
+  %(prog)s -f repos.txt -s 2024-01-01 -e 2024-12-31 --aggregate day-author-language
+
+  # Uncompressed Arrow IPC file that can be memory-mapped
+  %(prog)s -f repos.txt -s 2024-01-01 -e 2024-12-31 --format arrow
+
+  # Leave dependencies, lockfiles, build output and generated files out
+  %(prog)s -f repos.txt -s 2024-01-01 -e 2024-12-31 --exclude node_modules --exclude '*.lock' --exclude /dist --exclude-generated
+
+  # One CSV file per repository and day, for uploads that skip unchanged days
+  %(prog)s -f repos.txt -s 2024-01-01 -e 2024-12-31 --partition -o partitions
+
+  # Upload gzipped CSV while extracting, without writing a file
+  %(prog)s -f repos.txt -s 2024-01-01 -e 2024-12-31 --upload-url https://api.example.com/upload --user-id USER_ID --upload-key YOUR_API_KEY --upload-compression gzip
         """
     )
 
@@ -188,6 +1882,158 @@ Examples:
         help="End date"
     )
 
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of repositories to extract in parallel worker processes (default: 1)"
+    )
+    parser.add_argument(
+        "--diff-workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of concurrent git diff processes per repository (default: 1)"
+    )
+
+    # Clone cache
+    parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        help="Keep bare mirrors of remote repositories in DIR and fetch them on later runs"
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        default="10G",
+        metavar="SIZE",
+        help="Size budget for --cache-dir; least recently used mirrors are evicted (default: 10G)"
+    )
+
+    # Metrics cache
+    parser.add_argument(
+        "--metrics-cache",
+        metavar="FILE",
+        help="SQLite file caching per-commit numstat, so commits seen in earlier runs are not diffed again"
+    )
+    parser.add_argument(
+        "--prune-metrics-cache",
+        type=int,
+        metavar="DAYS",
+        help="After the run, drop metrics cache entries not used in the last DAYS days"
+    )
+
+    # Incremental extraction
+    parser.add_argument(
+        "--state-file",
+        metavar="FILE",
+        help="JSON file with the ref tips processed per repository; "
+             "later runs only extract commits added since then"
+    )
+
+    # Clone strategy
+    parser.add_argument(
+        "--shallow-clone",
+        action="store_true",
+        help="Clone remote repositories only back to the start date (ignored with --cache-dir)"
+    )
+    parser.add_argument(
+        "--filter-blobs",
+        action="store_true",
+        help="Make partial clones (--filter=blob:none); file contents are fetched only for diffed commits"
+    )
+
+    # Language detection
+    parser.add_argument(
+        "--detect-shebangs",
+        action="store_true",
+        help="Classify files no file name or extension rule knows by the interpreter on their #! line"
+    )
+    parser.add_argument(
+        "--language-map",
+        metavar="FILE",
+        help="JSON file with \"extensions\", \"filenames\" and \"interpreters\" mappings to add to "
+             "or override the built-in language tables"
+    )
+
+    # Path filters
+    parser.add_argument(
+        "--include",
+        action="append",
+        metavar="GLOB",
+        help="Only count files matching GLOB (.gitignore-style; repeatable)"
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        metavar="GLOB",
+        help="Don't count files matching GLOB, e.g. node_modules or '*.lock' (.gitignore-style; repeatable)"
+    )
+    parser.add_argument(
+        "--exclude-generated",
+        action="store_true",
+        help="Don't count files marked linguist-generated or linguist-vendored in the .gitattributes at HEAD"
+    )
+
+    # Output
+    parser.add_argument(
+        "-o", "--output",
+        metavar="FILE",
+        help="Output file; unless --format is given, the format follows the extension "
+             "(default: commits_START_to_END.FORMAT)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=list(OUTPUT_FORMATS),
+        help="Output format (default: from the --output extension, otherwise xlsx)"
+    )
+    parser.add_argument(
+        "--compression",
+        choices=["none", "zstd", "lz4", "snappy", "gzip", "brotli"],
+        help="Compression codec for parquet (default: zstd) and arrow (default: none) output"
+    )
+    parser.add_argument(
+        "--normalize",
+        action="store_true",
+        help="Write each commit once to a NAME_commits file and its files to a NAME_file_changes file, "
+             "joined on commit_id, instead of repeating commit fields on every row"
+    )
+    parser.add_argument(
+        "--aggregate",
+        choices=list(AGGREGATE_TABLES),
+        help="Write totals per commit and language, per day, author and language, or per day and "
+             "language (each per repository) instead of one row per changed file"
+    )
+    parser.add_argument(
+        "--partition",
+        action="store_true",
+        help="Write one file per repository and day, REPO_YYYY-MM-DD.EXT, into the --output directory "
+             "(default: commits_START_to_END; default format: csv)"
+    )
+
+    # Direct upload
+    parser.add_argument(
+        "--upload-url",
+        metavar="URL",
+        help="Stream the output to this upload endpoint while extracting instead of writing it to disk; "
+             "--output then only names the uploaded file (default format: csv)"
+    )
+    parser.add_argument(
+        "--user-id",
+        metavar="ID",
+        help="User ID sent with the upload (required with --upload-url)"
+    )
+    parser.add_argument(
+        "--upload-key",
+        metavar="KEY",
+        help="API key for the upload endpoint (sent as X-API-Key)"
+    )
+    parser.add_argument(
+        "--upload-compression",
+        choices=["gzip", "zstd"],
+        help="Compress the upload body on the fly (zstd requires zstandard)"
+    )
+
     # Verbose flag
     parser.add_argument(
         "-v", "--verbose",
@@ -204,6 +2050,27 @@ Examples:
     if args.repository and args.file:
         parser.error("Cannot use both a repository argument and --file option at the same time")
 
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    if args.diff_workers < 1:
+        parser.error("--diff-workers must be at least 1")
+
+    if args.prune_metrics_cache is not None and not args.metrics_cache:
+        parser.error("--prune-metrics-cache requires --metrics-cache")
+
+    if args.normalize and args.aggregate:
+        parser.error("--normalize can't be combined with --aggregate")
+
+    if args.partition and (args.normalize or args.state_file or args.upload_url):
+        parser.error("--partition can't be combined with --normalize, --state-file or --upload-url")
+
+    if args.upload_url and not args.user_id:
+        parser.error("--upload-url requires --user-id")
+
+    if (args.user_id or args.upload_key or args.upload_compression) and not args.upload_url:
+        parser.error("--user-id, --upload-key and --upload-compression require --upload-url")
+
     try:
         start_date = parse_date(args.start)
         end_date = parse_date(args.end)
@@ -215,7 +2082,19 @@ Examples:
         print("Error: Start date is later than end date.")
         return
 
-    repo_data: Dict[str, List[CommitMetrics]] = {}
+    metrics_cache = MetricsCache(os.path.expanduser(args.metrics_cache)) if args.metrics_cache else None
+
+    clone_cache: CloneCache | None = None
+    if args.cache_dir:
+        try:
+            clone_cache = CloneCache(
+                os.path.expanduser(args.cache_dir), parse_size(args.cache_max_size), args.filter_blobs
+            )
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+
+    run_started = datetime.now().timestamp()
 
     if args.file:
         # Process multiple repositories from file
@@ -233,23 +2112,139 @@ Examples:
         # Process single repository
         repo_inputs = [args.repository]
 
-    for repo_input in repo_inputs:
-        commits = process_repository(repo_input, start_date, end_date, args.verbose)
-        if commits:
-            repo_name = commits[0].repository
-            repo_data[repo_name] = commits
+    state: ExtractionState | None = None
+    if args.state_file:
+        try:
+            state = ExtractionState.load(args.state_file)
+        except ValueError as e:
+            print(f"Error: Invalid state file {args.state_file}: {e}")
+            return
+
+    language_map: LanguageMap | None = None
+    if args.language_map:
+        try:
+            with open(args.language_map, "r", encoding="utf-8") as f:
+                language_map = LanguageMap.model_validate_json(f.read())
+        except (OSError, ValueError) as e:
+            print(f"Error: Invalid language map {args.language_map}: {e}")
+            return
+
+    try:
+        path_filter = PathFilter(args.include, args.exclude, args.exclude_generated)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    open_output: Callable[[str], BinaryIO] | None = None
+    upload_session: Any = None
+    if args.upload_url:
+        try:
+            from upload_to_endpoint import StreamingUpload, create_session
+        except ImportError as e:
+            print(f"Error: --upload-url requires upload_to_endpoint.py next to this script and requests: {e}")
+            return
+
+        # Normalized output is two uploads; they share the connection pool
+        upload_session = create_session(pool_size=2)
 
-    if not repo_data:
+        def open_output(path: str) -> BinaryIO:
+            return StreamingUpload(
+                args.upload_url,
+                os.path.basename(path),
+                args.user_id,
+                args.upload_key,
+                args.upload_compression,
+                session=upload_session,
+                verbose=args.verbose,
+            )
+
+    output_format = args.format
+    if output_format is None and (args.partition or not args.output):
+        output_format = "csv" if args.upload_url or args.partition else "xlsx"
+    if args.partition:
+        output_file = args.output or f"commits_{start_date}_to_{end_date}"
+    else:
+        output_file = args.output or f"commits_{start_date}_to_{end_date}.{output_format}"
+    try:
+        try:
+            sink = create_sink(
+                output_file,
+                output_format,
+                args.compression,
+                args.normalize,
+                args.aggregate,
+                open_output,
+                args.partition,
+            )
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+
+        skipped = 0
+        try:
+            for repo_input, result in process_repositories(
+                repo_inputs,
+                start_date,
+                end_date,
+                jobs=args.jobs,
+                checkpoints=state.repositories if state is not None else None,
+                sink=sink,
+                verbose=args.verbose,
+                diff_workers=args.diff_workers,
+                clone_cache=clone_cache,
+                shallow_clone=args.shallow_clone,
+                filter_blobs=args.filter_blobs,
+                metrics_cache=metrics_cache,
+                skip_unchanged=state is not None,
+                language_detector=LanguageDetector(language_map, args.detect_shebangs),
+                path_filter=path_filter,
+            ):
+                if result is None:
+                    continue
+                if result.skipped:
+                    skipped += 1
+                if state is not None and result.checkpoint is not None:
+                    state.repositories[repo_input] = result.checkpoint
+
+            sink.close()
+        except (OSError, PartialExportError) as e:
+            # The output is incomplete (or could not be uploaded), so the checkpoints must not move
+            print(f"Error: {e}")
+            sys.exit(1)
+    finally:
+        # Closed once the sink has finished its uploads
+        if upload_session is not None:
+            upload_session.close()
+
+    if state is not None:
+        print(f"Skipped {skipped} of {len(repo_inputs)} repositories with no changes since the last run")
+
+    if clone_cache is not None:
+        clone_cache.evict(keep_since=run_started, verbose=args.verbose)
+
+    if metrics_cache is not None:
+        if args.prune_metrics_cache is not None:
+            removed = metrics_cache.prune(args.prune_metrics_cache)
+            if args.verbose:
+                print(f"Pruned {removed} entries from the metrics cache")
+        metrics_cache.close()
+
+    if sink.rows_written == 0:
         print("No commits found in the date range.")
+        if state is not None:
+            state.save(args.state_file)
         return
 
-    output_file = f"commits_{start_date}_to_{end_date}.xlsx"
-    with pd.ExcelWriter(output_file, engine="xlsxwriter") as writer:
-        for repo_name, commits in repo_data.items():
-            df = pd.DataFrame([c.model_dump() for c in commits])
-            df.to_excel(writer, sheet_name=repo_name[:31], index=False)
+    # Only record the new checkpoints once their rows are safely written
+    if state is not None:
+        state.save(args.state_file)
 
-    print(f"Export completed successfully: {output_file}")
+    if args.upload_url:
+        print(f"Upload completed successfully: {', '.join(os.path.basename(path) for path in sink.paths)}")
+    elif args.partition:
+        print(f"Export completed successfully: {len(sink.paths)} partitions in {output_file}")
+    else:
+        print(f"Export completed successfully: {', '.join(sink.paths)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,654 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+READ_SIZE = 1 << 16
+MAX_HEADER_SIZE = 1 << 16
+MAX_CHUNK_SIZE = 256 << 20
+UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def iter_request_body(rfile: BinaryIO, headers: Any) -> Iterator[bytes]:
+    """
+    Read a request body as it arrives, with or without chunked transfer encoding.
+
+    Args:
+        rfile: The request's input stream
+        headers: The request headers
+
+    Yields:
+        Raw body chunks, before any Content-Encoding is undone
+    """
+    if headers.get("Transfer-Encoding", "").lower() == "chunked":
+        while True:
+            size = int(rfile.readline().split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # Skip trailers up to the blank line that ends the body
+                while rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            while size > 0:
+                chunk = rfile.read(min(size, READ_SIZE))
+                if not chunk:
+                    raise ValueError("Request body ended early")
+                size -= len(chunk)
+                yield chunk
+            rfile.readline()
+    else:
+        remaining = int(headers.get("Content-Length", 0))
+        while remaining > 0:
+            chunk = rfile.read(min(remaining, READ_SIZE))
+            if not chunk:
+                raise ValueError("Request body ended early")
+            remaining -= len(chunk)
+            yield chunk
+
+
+def create_decompressor(encoding: str) -> Any:
+    """
+    Create an incremental decompressor for a Content-Encoding.
+
+    Args:
+        encoding: Content-Encoding header value ("", "identity", "gzip" or "zstd")
+
+    Returns:
+        An object with a decompress(data) method, or None for identity
+
+    Raises:
+        ValueError: If the encoding is not supported
+    """
+    if encoding in ("", "identity"):
+        return None
+    if encoding == "gzip":
+        return zlib.decompressobj(47)
+    if encoding == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd Content-Encoding requires zstandard. Install it with: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+
+
+def iter_decoded(chunks: Iterator[bytes], encoding: str) -> Iterator[bytes]:
+    """
+    Undo the Content-Encoding of a body while it is being read.
+
+    Args:
+        chunks: Raw body chunks
+        encoding: Content-Encoding header value
+
+    Yields:
+        Decoded body chunks
+    """
+    decompressor = create_decompressor(encoding)
+    if decompressor is None:
+        yield from chunks
+        return
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if not getattr(decompressor, "eof", True):
+        raise ValueError("Compressed body ended early")
+
+
+def parse_multipart(
+    chunks: Iterator[bytes],
+    boundary: bytes,
+    on_part: Callable[[Dict[str, str]], BinaryIO]
+) -> None:
+    """
+    Parse a multipart/form-data body without holding it in memory.
+
+    Args:
+        chunks: Decoded body chunks
+        boundary: The boundary from the Content-Type header
+        on_part: Called with each part's headers (lower-cased names); returns the
+            writable stream the part's content is copied to
+
+    Raises:
+        ValueError: If the body is not well-formed multipart
+    """
+    delimiter = b"--" + boundary
+    separator = b"\r\n" + delimiter
+    buffer = b""
+
+    def fill() -> None:
+        nonlocal buffer
+        chunk = next(chunks, b"")
+        if not chunk:
+            raise ValueError("Multipart body ended early")
+        buffer += chunk
+
+    while delimiter + b"\r\n" not in buffer[:len(delimiter) + 2]:
+        if len(buffer) >= len(delimiter) + 2:
+            raise ValueError("Multipart body does not start with the boundary")
+        fill()
+    buffer = buffer[len(delimiter) + 2:]
+
+    while True:
+        while b"\r\n\r\n" not in buffer:
+            if len(buffer) > MAX_HEADER_SIZE:
+                raise ValueError("Multipart headers too large")
+            fill()
+        raw_headers, buffer = buffer.split(b"\r\n\r\n", 1)
+        headers = {}
+        for line in raw_headers.decode("utf-8").split("\r\n"):
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        out = on_part(headers)
+        # Copy content up to the next boundary, holding back enough bytes to
+        # recognize a boundary split across chunks
+        while True:
+            index = buffer.find(separator)
+            if index >= 0:
+                out.write(buffer[:index])
+                buffer = buffer[index + len(separator):]
+                break
+            keep = len(separator) - 1
+            if len(buffer) > keep:
+                out.write(buffer[:-keep])
+                buffer = buffer[-keep:]
+            fill()
+
+        while len(buffer) < 2:
+            fill()
+        if buffer.startswith(b"--"):
+            return
+        if not buffer.startswith(b"\r\n"):
+            raise ValueError("Malformed multipart boundary")
+        buffer = buffer[2:]
+
+
+def content_disposition(value: str) -> Dict[str, str]:
+    """
+    Parse the parameters of a Content-Disposition header.
+
+    Args:
+        value: Header value, e.g. 'form-data; name="file"; filename="a.xlsx"'
+
+    Returns:
+        Parameter names mapped to their (unquoted) values
+    """
+    params = {}
+    for item in value.split(";")[1:]:
+        name, _, param = item.strip().partition("=")
+        params[name.lower()] = param.strip('"')
+    return params
+
+
+class HashingWriter:
+    """
+    Writable stream that hashes and counts what is written to an optional file.
+    """
+
+    def __init__(self, f: Optional[BinaryIO] = None):
+        self.f = f
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.data = b""
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        self.sha256.update(data)
+        if self.f is not None:
+            self.f.write(data)
+        elif len(self.data) < MAX_HEADER_SIZE:
+            # Form fields are small; keep them for the response
+            self.data += data
+
+
+class ResumableStore:
+    """
+    Upload sessions of the resumable protocol (see upload_file_resumable in
+    upload_to_endpoint.py), kept on disk so they survive client and receiver restarts.
+
+    Each session is a data file holding the acknowledged bytes and a JSON file
+    with its metadata. The session id is derived from the user, file name, size
+    and hash, so opening the same upload again finds the existing session.
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.partial_dir = os.path.join(output_dir, ".partial")
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__locks: Dict[str, threading.Lock] = {}
+
+    def lock(self, upload_id: str) -> threading.Lock:
+        with self.__lock:
+            return self.__locks.setdefault(upload_id, threading.Lock())
+
+    def create(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Open a session, or return the existing one for the same upload.
+
+        Args:
+            metadata: {user_id, filename, size, sha256} from the client
+
+        Returns:
+            {upload_id, offset}
+
+        Raises:
+            ValueError: If the metadata is incomplete
+        """
+        try:
+            metadata = {
+                "user_id": str(metadata["user_id"]),
+                "filename": os.path.basename(str(metadata["filename"])),
+                "size": int(metadata["size"]),
+                "sha256": str(metadata["sha256"]).lower(),
+            }
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Expected user_id, filename, size and sha256")
+        key = "\0".join(str(metadata[name]) for name in ("user_id", "filename", "size", "sha256"))
+        upload_id = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+        with self.lock(upload_id):
+            if self.metadata(upload_id) is None:
+                open(self.__data_path(upload_id), "wb").close()
+                self.__save(upload_id, {**metadata, "completed": None})
+            return {"upload_id": upload_id, "offset": self.offset(upload_id)}
+
+    def metadata(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.__metadata_path(upload_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def offset(self, upload_id: str) -> int:
+        metadata = self.metadata(upload_id)
+        if metadata is not None and metadata["completed"] is not None:
+            return metadata["size"]
+        return os.path.getsize(self.__data_path(upload_id))
+
+    def append(self, upload_id: str, data: bytes) -> int:
+        """
+        Store a chunk at the end of the session's data and return the new offset.
+
+        The data is flushed to disk before the offset is acknowledged.
+        """
+        with open(self.__data_path(upload_id), "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return self.offset(upload_id)
+
+    def complete(self, upload_id: str) -> Dict[str, Any]:
+        """
+        Check the whole file and move it to the output directory.
+
+        Returns:
+            {path, bytes, sha256} of the stored file
+
+        Raises:
+            ValueError: If the size or hash doesn't match what the session was opened with.
+                The session then starts over from offset 0.
+        """
+        metadata = self.metadata(upload_id)
+        if metadata["completed"] is not None:
+            return metadata["completed"]
+
+        data_path = self.__data_path(upload_id)
+        size = os.path.getsize(data_path)
+        sha256 = hashlib.sha256()
+        with open(data_path, "rb") as f:
+            while True:
+                chunk = f.read(1 << 20)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+        if size != metadata["size"] or sha256.hexdigest() != metadata["sha256"]:
+            open(data_path, "wb").close()
+            raise ValueError(f"Uploaded file doesn't match: {size} bytes, sha256 {sha256.hexdigest()}")
+
+        path = os.path.join(self.output_dir, metadata["filename"])
+        shutil.move(data_path, path)
+        completed = {"path": path, "bytes": size, "sha256": metadata["sha256"]}
+        self.__save(upload_id, {**metadata, "completed": completed})
+        return completed
+
+    def __save(self, upload_id: str, metadata: Dict[str, Any]) -> None:
+        path = self.__metadata_path(upload_id)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(metadata, f)
+        os.replace(f"{path}.tmp", path)
+
+    def __data_path(self, upload_id: str) -> str:
+        return os.path.join(self.partial_dir, f"{upload_id}.part")
+
+    def __metadata_path(self, upload_id: str) -> str:
+        return os.path.join(self.partial_dir, f"{upload_id}.json")
+
+
+class ReceiverHandler(BaseHTTPRequestHandler):
+    """
+    Accepts uploads from upload_to_endpoint.py and stores the files.
+
+    A POST to any path is a multipart upload; paths ending in /resumable and below
+    it are the resumable protocol. Responses are JSON describing what was received,
+    including each file's size and SHA-256 so clients can check the transfer.
+    """
+
+    output_dir = "received"
+    api_key: Optional[str] = None
+    store: Optional[ResumableStore] = None
+    fail_rate = 0.0
+    latency = 0.0
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; with Nagle's algorithm the body would
+    # wait for the client's delayed ACK on every kept-alive request
+    disable_nagle_algorithm = True
+
+    def do_POST(self) -> None:
+        if not self.authorize():
+            return
+        upload_id, action = self.resumable_route()
+        if upload_id == "":
+            self.create_upload()
+        elif upload_id is not None and action == "complete":
+            self.complete_upload(upload_id)
+        elif upload_id is not None:
+            self.reject(404, "Not found")
+        else:
+            self.receive_multipart()
+
+    def do_PUT(self) -> None:
+        if not self.authorize():
+            return
+        upload_id, action = self.resumable_route()
+        if not upload_id or action:
+            self.reject(404, "Not found")
+            return
+        self.receive_chunk(upload_id)
+
+    def do_GET(self) -> None:
+        if not self.authorize():
+            return
+        upload_id, action = self.resumable_route()
+        if not upload_id or action:
+            self.reject(404, "Not found")
+            return
+        if self.store.metadata(upload_id) is None:
+            self.send_json(404, {"error": "Unknown upload"})
+            return
+        self.send_json(200, {"upload_id": upload_id, "offset": self.store.offset(upload_id)})
+
+    def authorize(self) -> bool:
+        if self.api_key is not None and self.headers.get("X-API-Key") != self.api_key:
+            self.reject(401, "Invalid API key")
+            return False
+        return True
+
+    def reject(self, status: int, error: str) -> None:
+        # The body is not read, so the connection can't be reused
+        self.close_connection = True
+        self.send_json(status, {"error": error})
+
+    def resumable_route(self) -> Tuple[Optional[str], str]:
+        # (None, "") outside the protocol, ("", "") for /resumable itself,
+        # (upload_id, action) below it
+        segments = urlsplit(self.path).path.rstrip("/").split("/")
+        if "resumable" not in segments:
+            return None, ""
+        below = segments[segments.index("resumable") + 1:]
+        if not below:
+            return "", ""
+        if not UPLOAD_ID_PATTERN.match(below[0]) or len(below) > 2:
+            return "invalid", "invalid"
+        return below[0], below[1] if len(below) > 1 else ""
+
+    def create_upload(self) -> None:
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_HEADER_SIZE:
+                raise ValueError("Request too large")
+            created = self.store.create(json.loads(self.rfile.read(length) or b"{}"))
+        except ValueError as e:
+            self.reject(400, str(e))
+            return
+        print(f"Upload {created['upload_id']} open at offset {created['offset']}")
+        self.send_json(201, created)
+
+    def receive_chunk(self, upload_id: str) -> None:
+        if self.store.metadata(upload_id) is None:
+            self.reject(404, "Unknown upload")
+            return
+        try:
+            offset = int(self.headers["Upload-Offset"])
+            algorithm, checksum = self.headers["Upload-Checksum"].split(None, 1)
+        except (KeyError, TypeError, ValueError):
+            self.reject(400, "Expected Upload-Offset and Upload-Checksum: sha256 <hex> headers")
+            return
+        if algorithm.lower() != "sha256":
+            self.reject(400, f"Unsupported checksum algorithm: {algorithm}")
+            return
+
+        try:
+            chunks = iter_decoded(
+                iter_request_body(self.rfile, self.headers), self.headers.get("Content-Encoding", "").strip().lower()
+            )
+            data = bytearray()
+            for chunk in chunks:
+                data += chunk
+                if len(data) > MAX_CHUNK_SIZE:
+                    raise ValueError(f"Chunks can be at most {MAX_CHUNK_SIZE} bytes")
+        except ValueError as e:
+            self.reject(400, str(e))
+            return
+
+        if random.random() < self.fail_rate / 2:
+            # Simulated failure before the chunk is stored
+            self.close_connection = True
+            return
+        if hashlib.sha256(data).hexdigest() != checksum.strip().lower():
+            self.send_json(460, {"error": "Checksum mismatch"})
+            return
+
+        with self.store.lock(upload_id):
+            current = self.store.offset(upload_id)
+            if offset != current:
+                self.send_json(409, {"error": "Offset mismatch", "offset": current})
+                return
+            if current + len(data) > self.store.metadata(upload_id)["size"]:
+                self.send_json(400, {"error": "Chunk goes past the end of the file", "offset": current})
+                return
+            new_offset = self.store.append(upload_id, data)
+
+        if random.random() < self.fail_rate / 2:
+            # Simulated failure after the chunk is stored: the acknowledgement is lost
+            self.close_connection = True
+            return
+        self.send_json(200, {"upload_id": upload_id, "offset": new_offset})
+
+    def complete_upload(self, upload_id: str) -> None:
+        if self.store.metadata(upload_id) is None:
+            self.reject(404, "Unknown upload")
+            return
+        try:
+            with self.store.lock(upload_id):
+                completed = self.store.complete(upload_id)
+        except ValueError as e:
+            self.send_json(422, {"error": str(e), "offset": 0})
+            return
+        print(f"Received {completed['path']}: {completed['bytes']} bytes (resumable upload {upload_id})")
+        self.send_json(200, {"files": [completed]})
+
+    def receive_multipart(self) -> None:
+        content_type = self.headers.get("Content-Type", "")
+        if not content_type.startswith("multipart/form-data") or "boundary=" not in content_type:
+            self.reject(415, "Expected multipart/form-data")
+            return
+        boundary = content_type.split("boundary=", 1)[1].split(";", 1)[0].strip('"').encode("utf-8")
+
+        started = time.monotonic()
+        raw = iter_request_body(self.rfile, self.headers)
+        wire_bytes = 0
+
+        def counted() -> Iterator[bytes]:
+            nonlocal wire_bytes
+            for chunk in raw:
+                wire_bytes += len(chunk)
+                yield chunk
+
+        fields: Dict[str, str] = {}
+        files = []
+        parts = []
+
+        def on_part(headers: Dict[str, str]) -> HashingWriter:
+            params = content_disposition(headers.get("content-disposition", ""))
+            filename = params.get("filename")
+            if filename:
+                path = os.path.join(self.output_dir, os.path.basename(filename))
+                writer = HashingWriter(open(path, "wb"))
+                files.append((path, writer))
+            else:
+                writer = HashingWriter()
+            parts.append((params.get("name", ""), writer))
+            return writer
+
+        try:
+            encoding = self.headers.get("Content-Encoding", "").strip().lower()
+            decoded = iter_decoded(counted(), encoding)
+            parse_multipart(decoded, boundary, on_part)
+            # Read up to the end of the body, so truncated compressed bodies are
+            # caught and the connection can be reused
+            for _ in decoded:
+                pass
+        except ValueError as e:
+            self.reject(400, str(e))
+            return
+        finally:
+            for _, writer in files:
+                writer.f.close()
+
+        for name, writer in parts:
+            if writer.f is None:
+                fields[name] = writer.data.decode("utf-8", "replace")
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        received = [
+            {"path": path, "bytes": writer.size, "sha256": writer.sha256.hexdigest()}
+            for path, writer in files
+        ]
+        for entry in received:
+            print(
+                f"Received {entry['path']}: {entry['bytes']} bytes ({wire_bytes} on the wire, "
+                f"{encoding or 'identity'}) in {elapsed:.2f}s, {entry['bytes'] / 2**20 / elapsed:.1f} MiB/s"
+            )
+        self.send_json(200, {"fields": fields, "files": received, "wire_bytes": wire_bytes, "seconds": elapsed})
+
+    def send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # The summary printed per upload is enough
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the upload endpoint, for testing upload_to_endpoint.py offline",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Receive uploads on http://127.0.0.1:8000/upload and store them in ./received
+  %(prog)s
+
+  # Require an API key and store files elsewhere
+  %(prog)s --port 9000 --output-dir /tmp/uploads --key YOUR_API_KEY
+
+  # Drop 20%% of resumable chunk requests, to exercise retries and resuming
+  %(prog)s --fail-rate 0.2
+
+  # Answer like an endpoint 50 ms away, to benchmark concurrent uploads
+  %(prog)s --latency 0.05
+        """
+    )
+
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on (default: 127.0.0.1)"
+    )
+
+    parser.add_argument(
+        "-p", "--port",
+        type=int,
+        default=8000,
+        help="Port to listen on (default: 8000)"
+    )
+
+    parser.add_argument(
+        "-o", "--output-dir",
+        default="received",
+        help="Directory to store received files in (default: received)"
+    )
+
+    parser.add_argument(
+        "-k", "--key",
+        help="Only accept requests with this 'X-API-Key' header"
+    )
+
+    parser.add_argument(
+        "--fail-rate",
+        type=float,
+        default=0.0,
+        metavar="P",
+        help="Fraction of resumable chunk requests to drop without an answer, half of them "
+             "after the chunk was stored (default: 0)"
+    )
+
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Wait this long before every response, to simulate a remote endpoint (default: 0)"
+    )
+
+    args = parser.parse_args()
+
+    if not 0.0 <= args.fail_rate <= 1.0:
+        parser.error("--fail-rate must be between 0 and 1")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    ReceiverHandler.output_dir = args.output_dir
+    ReceiverHandler.api_key = args.key
+    ReceiverHandler.store = ResumableStore(args.output_dir)
+    ReceiverHandler.fail_rate = args.fail_rate
+    ReceiverHandler.latency = args.latency
+
+    server = ThreadingHTTPServer((args.host, args.port), ReceiverHandler)
+    print(f"Listening on http://{args.host}:{server.server_port}, storing files in {args.output_dir}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
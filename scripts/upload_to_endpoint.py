@@ -1,8 +1,336 @@
 import argparse
+import hashlib
+import io
+import json
 import os
+import queue
+import random
 import sys
+import threading
+import time
+import uuid
+import zlib
 import requests
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from requests.adapters import HTTPAdapter
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+COMPRESSIONS = ["gzip", "zstd"]
+CHUNK_SIZE = 1 << 20
+PROGRESS_INTERVAL = 10.0
+CONCURRENCY = 4
+
+# Resumable protocol
+RESUMABLE_CHUNK_SIZE = 8 << 20
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# 460 is the checksum mismatch status of the tus protocol
+RETRY_STATUSES = {408, 429, 460, 500, 502, 503, 504}
+
+
+def create_compressor(compression: str) -> Any:
+    """
+    Create an incremental compressor for a Content-Encoding.
+
+    Args:
+        compression: "gzip" or "zstd"
+
+    Returns:
+        An object with compress(data) and flush() methods
+
+    Raises:
+        ValueError: If the encoding is unknown or its library is not installed
+    """
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression requires zstandard. Install it with: pip install zstandard")
+        return zstandard.ZstdCompressor().compressobj()
+    raise ValueError(f"Unknown compression: {compression}. Use one of: {', '.join(COMPRESSIONS)}")
+
+
+def multipart_envelope(boundary: str, fields: Dict[str, str], filename: str) -> Tuple[bytes, bytes]:
+    """
+    Build what goes before and after the file's bytes in a multipart/form-data body.
+
+    Args:
+        boundary: The multipart boundary
+        fields: Form fields sent before the file
+        filename: Name of the uploaded file
+
+    Returns:
+        The head (form fields and the file part's headers) and the tail (closing boundary)
+    """
+    head = "".join(
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+        f"{value}\r\n"
+        for name, value in fields.items()
+    )
+    head += (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    )
+    return head.encode("utf-8"), f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+
+class MultipartBody:
+    """
+    Streaming multipart/form-data request body with one file part.
+
+    The file is read in chunks while the request is sent, so it is never held in
+    memory. With compression the whole body is compressed on the fly and has to
+    be sent with a matching Content-Encoding header; its length is then unknown
+    up front and requests falls back to chunked transfer encoding.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        fields: Dict[str, str],
+        compression: Optional[str] = None,
+        chunk_size: int = CHUNK_SIZE,
+        verbose: bool = False
+    ):
+        self.file_path = file_path
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.verbose = verbose
+        self.file_size = os.path.getsize(file_path)
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.bytes_read = 0
+        self.bytes_sent = 0
+        self.started = 0.0
+        self.finished = 0.0
+
+        self.__head, self.__tail = multipart_envelope(self.boundary, fields, os.path.basename(file_path))
+        # Fail before connecting if the compressor is not available
+        self.__compressor = create_compressor(compression) if compression else None
+
+    def __len__(self) -> int:
+        # Only used (by requests, for Content-Length) when the body is not compressed
+        return len(self.__head) + self.file_size + len(self.__tail)
+
+    def __iter__(self) -> Iterator[bytes]:
+        self.started = time.monotonic()
+        last_report = self.started
+        for chunk in self.__iter_raw():
+            if self.__compressor is not None:
+                chunk = self.__compressor.compress(chunk)
+            if chunk:
+                self.bytes_sent += len(chunk)
+                yield chunk
+
+            now = time.monotonic()
+            if self.verbose and now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                print(f"  {format_progress(self.bytes_read, self.file_size, now - self.started)}")
+
+        if self.__compressor is not None:
+            chunk = self.__compressor.flush()
+            self.bytes_sent += len(chunk)
+            yield chunk
+        self.finished = time.monotonic()
+
+    def summary(self) -> str:
+        """
+        Describe how much was sent and how fast.
+
+        Returns:
+            A one-line throughput report for the finished upload
+        """
+        summary = f"Sent {format_progress(self.bytes_read, self.file_size, self.finished - self.started)}"
+        if self.compression:
+            # len() is the size of the uncompressed body
+            ratio = self.bytes_sent / len(self)
+            summary += f"; {self.bytes_sent / 2**20:.1f} MiB on the wire with {self.compression} ({ratio:.0%})"
+        return summary
+
+    def __iter_raw(self) -> Iterator[bytes]:
+        yield self.__head
+        with open(self.file_path, "rb") as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.bytes_read += len(chunk)
+                yield chunk
+        yield self.__tail
+
+
+class StreamingUpload(io.RawIOBase):
+    """
+    Writable binary stream that is uploaded while it is being written.
+
+    The bytes written become the file part of a multipart/form-data request sent
+    with chunked transfer encoding from a background thread, so producing the data
+    and sending it overlap, and nothing is written to disk. At most `queue_size`
+    chunks are buffered: writes block while the connection is slower than the
+    producer. Failures surface as OSError from write() or close(), as they would
+    for a regular file.
+    """
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        filename: str,
+        user_id: str,
+        auth_key: Optional[str] = None,
+        compression: Optional[str] = None,
+        session: Optional[requests.Session] = None,
+        chunk_size: int = CHUNK_SIZE,
+        queue_size: int = 16,
+        verbose: bool = False
+    ):
+        super().__init__()
+        self.endpoint_url = endpoint_url
+        self.filename = filename
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.verbose = verbose
+        self.response: Optional[requests.Response] = None
+        self.bytes_sent = 0
+        self.__session = session or requests
+        self.__compressor = create_compressor(compression) if compression else None
+        self.__boundary = uuid.uuid4().hex
+        self.__head, self.__tail = multipart_envelope(self.__boundary, {"user_id": user_id}, filename)
+        self.__headers = {"Content-Type": f"multipart/form-data; boundary={self.__boundary}"}
+        if auth_key:
+            self.__headers["X-API-Key"] = auth_key
+        if compression:
+            self.__headers["Content-Encoding"] = compression
+
+        self.__buffer = bytearray()
+        self.__position = 0
+        self.__queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=queue_size)
+        self.__error: Optional[str] = None
+        self.__started = time.monotonic()
+        self.__thread = threading.Thread(target=self.__send, daemon=True)
+        self.__thread.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        # Writers such as Parquet's record offsets as they go
+        return self.__position
+
+    def write(self, data: Any) -> int:
+        if self.closed:
+            raise ValueError("write to closed file")
+        size = len(memoryview(data).cast("B"))
+        self.__buffer += data
+        self.__position += size
+        if len(self.__buffer) >= self.chunk_size:
+            self.__put(bytes(self.__buffer))
+            self.__buffer.clear()
+        return size
+
+    def close(self) -> None:
+        """
+        Send what is left, finish the request and wait for the response.
+
+        Raises:
+            OSError: If the upload failed
+        """
+        if self.closed:
+            return
+        try:
+            if self.__buffer:
+                self.__put(bytes(self.__buffer))
+                self.__buffer.clear()
+            self.__put(None)
+            self.__thread.join()
+        finally:
+            super().close()
+        if self.__error is not None:
+            raise OSError(f"Upload of {self.filename} failed: {self.__error}")
+        if self.verbose:
+            elapsed = time.monotonic() - self.__started
+            summary = f"Streamed {self.filename}: {format_progress(self.__position, self.__position, elapsed)}"
+            if self.compression:
+                summary += f"; {self.bytes_sent / 2**20:.1f} MiB on the wire with {self.compression}"
+            print(summary)
+
+    def __put(self, chunk: Optional[bytes]) -> None:
+        # Blocks while the queue is full, but not forever if the upload died
+        while True:
+            if self.__error is not None or not self.__thread.is_alive():
+                raise OSError(f"Upload of {self.filename} failed: {self.__error or 'connection closed'}")
+            try:
+                self.__queue.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def __body(self) -> Iterator[bytes]:
+        # Queued chunks until close() queues None
+        for chunk in chain([self.__head], iter(self.__queue.get, None), [self.__tail]):
+            if self.__compressor is not None:
+                chunk = self.__compressor.compress(chunk)
+            if chunk:
+                self.bytes_sent += len(chunk)
+                yield chunk
+
+        if self.__compressor is not None:
+            chunk = self.__compressor.flush()
+            self.bytes_sent += len(chunk)
+            yield chunk
+
+    def __send(self) -> None:
+        try:
+            response = self.__session.post(
+                self.endpoint_url, data=self.__body(), headers=self.__headers, timeout=300
+            )
+            response.raise_for_status()
+            self.response = response
+        except Exception as e:
+            self.__error = str(e)
+            if getattr(e, "response", None) is not None:
+                self.__error += f": {e.response.text[:200]}"
+
+
+def create_session(pool_size: int = 1) -> requests.Session:
+    """
+    Create a session whose keep-alive connections are reused across requests.
+
+    Args:
+        pool_size: How many connections per host to keep open, i.e. how many
+            requests are expected to run at the same time
+
+    Returns:
+        The session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def format_progress(done: int, total: int, elapsed: float) -> str:
+    """
+    Format upload progress for verbose output.
+
+    Args:
+        done: Bytes of the file read so far
+        total: Size of the file in bytes
+        elapsed: Seconds since the upload started
+
+    Returns:
+        Progress line with percentage and throughput
+    """
+    percent = done / total if total else 1.0
+    rate = done / 2**20 / max(elapsed, 1e-6)
+    return f"{done / 2**20:.1f} of {total / 2**20:.1f} MiB ({percent:.0%}), {rate:.1f} MiB/s"
 
 
 def upload_file(
@@ -10,17 +338,25 @@ def upload_file(
     endpoint_url: str,
     user_id: str,
     auth_key: Optional[str] = None,
-    verbose: bool = False
+    verbose: bool = False,
+    compression: Optional[str] = None,
+    session: Optional[requests.Session] = None
 ) -> bool:
     """
     Upload a file to a specified endpoint.
 
+    The file is streamed as a multipart/form-data body, optionally compressed
+    with a gzip or zstd Content-Encoding, so memory use does not depend on its size.
+
     Args:
         file_path: Path to the file to upload
         endpoint_url: URL endpoint to send the file to
         user_id: User ID for authentication
         auth_key: Optional authentication key
         verbose: Enable verbose output
+        compression: Optional Content-Encoding for the request body ("gzip" or "zstd")
+        session: Optional session to send the request with, so connections are reused
+            across uploads
 
     Returns:
         True if upload was successful, False otherwise
@@ -29,29 +365,35 @@ def upload_file(
         print(f"Error: File not found: {file_path}")
         return False
 
+    try:
+        body = MultipartBody(file_path, {"user_id": user_id}, compression, verbose=verbose)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return False
+
     if verbose:
         print(f"Uploading {file_path} to {endpoint_url}...")
 
     try:
-        headers = {}
+        headers = {"Content-Type": body.content_type}
         if auth_key:
             headers["X-API-Key"] = auth_key
+        if compression:
+            headers["Content-Encoding"] = compression
 
-        with open(file_path, "rb") as f:
-            files = {"file": (os.path.basename(file_path), f)}
-            data = {"user_id": user_id}
-            response = requests.post(
-                endpoint_url,
-                files=files,
-                data=data,
-                headers=headers,
-                timeout=300  # 5 minute timeout
-            )
+        response = (session or requests).post(
+            endpoint_url,
+            # Without a length, requests sends the body with chunked transfer encoding
+            data=iter(body) if compression else body,
+            headers=headers,
+            timeout=300  # 5 minute timeout
+        )
 
         response.raise_for_status()
 
         if verbose:
             print(f"Upload successful! Status code: {response.status_code}")
+            print(body.summary())
             print(f"Response: {response.text}")
 
         return True
@@ -64,9 +406,440 @@ def upload_file(
         return False
 
 
+class UploadError(Exception):
+    """
+    Raised when a resumable upload can't continue, after any retries.
+    """
+
+
+def call_with_retries(
+    request: Callable[[], requests.Response],
+    description: str,
+    max_retries: int = MAX_RETRIES,
+    verbose: bool = False
+) -> requests.Response:
+    """
+    Send a request, retrying connection failures and transient HTTP errors.
+
+    Args:
+        request: Sends the request and returns the response
+        description: What the request does, for messages
+        max_retries: How many times to retry before giving up
+        verbose: Enable verbose output
+
+    Returns:
+        The first response whose status is not retryable
+
+    Raises:
+        UploadError: If every attempt failed
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            response = request()
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = str(e)
+
+        if attempt == max_retries:
+            raise UploadError(f"{description} failed after {max_retries + 1} attempts: {error}")
+        backoff(attempt, f"{description} failed ({error})", verbose)
+    raise AssertionError("unreachable")
+
+
+def backoff(attempt: int, reason: str, verbose: bool = False) -> None:
+    """
+    Wait before retrying: 1 s, 2 s, 4 s, ... up to 60 s, with random jitter.
+
+    Args:
+        attempt: Number of the attempt that failed, starting at 0
+        reason: Why the attempt failed, for verbose output
+        verbose: Enable verbose output
+    """
+    delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX) * random.uniform(0.5, 1.0)
+    if verbose:
+        print(f"  {reason}, retrying in {delay:.1f}s")
+    time.sleep(delay)
+
+
+def file_sha256(file_path: str) -> str:
+    """
+    Hash a file in chunks.
+
+    Args:
+        file_path: Path to the file
+
+    Returns:
+        Hex SHA-256 of the file's contents
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def upload_file_resumable(
+    file_path: str,
+    endpoint_url: str,
+    user_id: str,
+    auth_key: Optional[str] = None,
+    verbose: bool = False,
+    compression: Optional[str] = None,
+    chunk_size: int = RESUMABLE_CHUNK_SIZE,
+    max_retries: int = MAX_RETRIES,
+    session: Optional[requests.Session] = None
+) -> bool:
+    """
+    Upload a file in acknowledged chunks that can resume after failures.
+
+    Protocol, relative to the endpoint URL:
+
+    - POST /resumable with JSON {user_id, filename, size, sha256} opens an upload
+      session, or reopens the existing one for the same file, and returns
+      {upload_id, offset}.
+    - PUT /resumable/<upload_id> sends the chunk starting at the "Upload-Offset"
+      header, with an "Upload-Checksum: sha256 <hex>" of its uncompressed bytes
+      and optionally a Content-Encoding. The server stores it and returns the new
+      {offset}. If the offset doesn't match, it answers 409 with its {offset}.
+    - GET /resumable/<upload_id> returns the acknowledged {offset}.
+    - POST /resumable/<upload_id>/complete checks the size and SHA-256 of the
+      whole file and finishes the upload.
+
+    Failed requests are retried with exponential backoff. After a failure the
+    acknowledged offset is asked for again, so only chunks the server did not
+    store are sent again. Because sessions are keyed by the file, running the
+    upload again after the process died continues where it stopped.
+
+    Args:
+        file_path: Path to the file to upload
+        endpoint_url: URL endpoint the protocol paths are relative to
+        user_id: User ID for authentication
+        auth_key: Optional authentication key
+        verbose: Enable verbose output
+        compression: Optional Content-Encoding for each chunk ("gzip" or "zstd")
+        chunk_size: Bytes of the file sent per request
+        max_retries: How many times each request is retried
+        session: Optional session to send the requests with, so connections are
+            reused across uploads
+
+    Returns:
+        True if upload was successful, False otherwise
+    """
+    if not os.path.isfile(file_path):
+        print(f"Error: File not found: {file_path}")
+        return False
+
+    try:
+        if compression:
+            create_compressor(compression)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return False
+
+    base_url = endpoint_url.rstrip("/") + "/resumable"
+    size = os.path.getsize(file_path)
+    own_session = session is None
+    session = session or create_session()
+    auth_headers = {"X-API-Key": auth_key} if auth_key else {}
+
+    def retry(request: Callable[[], requests.Response], description: str) -> requests.Response:
+        response = call_with_retries(request, description, max_retries, verbose)
+        response.raise_for_status()
+        return response
+
+    try:
+        if verbose:
+            print(f"Hashing {file_path}...")
+        metadata = {
+            "user_id": user_id,
+            "filename": os.path.basename(file_path),
+            "size": size,
+            "sha256": file_sha256(file_path),
+        }
+        created = retry(
+            lambda: session.post(base_url, json=metadata, headers=auth_headers, timeout=60), "Opening upload"
+        ).json()
+        upload_url = f"{base_url}/{created['upload_id']}"
+        offset = int(created["offset"])
+        if verbose:
+            state = f"resuming at {offset / 2**20:.1f} MiB" if offset else "starting"
+            print(f"Uploading {file_path} to {endpoint_url} ({state})...")
+
+        started = time.monotonic()
+        resumed_at = offset
+        last_report = started
+        with open(file_path, "rb") as f:
+            while offset < size:
+                f.seek(offset)
+                chunk = f.read(chunk_size)
+                offset = send_chunk(
+                    session, upload_url, offset, chunk, compression, auth_headers, max_retries, verbose
+                )
+
+                now = time.monotonic()
+                if verbose and now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    print(f"  {format_progress(offset - resumed_at, size - resumed_at, now - started)}")
+
+        response = retry(
+            lambda: session.post(f"{upload_url}/complete", headers=auth_headers, timeout=300), "Completing upload"
+        )
+        if verbose:
+            elapsed = time.monotonic() - started
+            print(f"Upload successful! Status code: {response.status_code}")
+            print(f"Sent {format_progress(offset - resumed_at, size - resumed_at, elapsed)}")
+            print(f"Response: {response.text}")
+        return True
+
+    except UploadError as e:
+        print(f"Error uploading file: {e}")
+        return False
+    except requests.exceptions.RequestException as e:
+        print(f"Error uploading file: {e}")
+        if hasattr(e, "response") and e.response is not None:
+            print(f"Response status code: {e.response.status_code}")
+            print(f"Response body: {e.response.text}")
+        return False
+    finally:
+        if own_session:
+            session.close()
+
+
+def send_chunk(
+    session: requests.Session,
+    upload_url: str,
+    offset: int,
+    chunk: bytes,
+    compression: Optional[str],
+    auth_headers: Dict[str, str],
+    max_retries: int,
+    verbose: bool
+) -> int:
+    """
+    Send one chunk of a resumable upload.
+
+    Args:
+        session: Session to send the requests with
+        upload_url: URL of the upload session
+        offset: Offset of the chunk in the file
+        chunk: The chunk's bytes
+        compression: Optional Content-Encoding for the chunk
+        auth_headers: Authentication headers to send with each request
+        max_retries: How many times to retry
+        verbose: Enable verbose output
+
+    Returns:
+        The offset the server acknowledged, which is where the next chunk starts
+
+    Raises:
+        UploadError: If the chunk could not be stored after all retries
+    """
+    headers = {
+        **auth_headers,
+        "Content-Type": "application/offset+octet-stream",
+        "Upload-Offset": str(offset),
+        "Upload-Checksum": f"sha256 {hashlib.sha256(chunk).hexdigest()}",
+    }
+    body = chunk
+    if compression:
+        compressor = create_compressor(compression)
+        body = compressor.compress(chunk) + compressor.flush()
+        headers["Content-Encoding"] = compression
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.put(upload_url, data=body, headers=headers, timeout=300)
+            if response.status_code == 409:
+                # The server is elsewhere, e.g. it stored this chunk but the answer was lost
+                return int(response.json()["offset"])
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                return int(response.json()["offset"])
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = str(e)
+
+        if attempt == max_retries:
+            break
+        backoff(attempt, f"Chunk at {offset} failed ({error})", verbose)
+
+        # The chunk may have been stored even though the request failed
+        response = call_with_retries(
+            lambda: session.get(upload_url, headers=auth_headers, timeout=60),
+            "Checking upload offset",
+            max_retries,
+            verbose
+        )
+        response.raise_for_status()
+        acknowledged = int(response.json()["offset"])
+        if acknowledged != offset:
+            return acknowledged
+
+    raise UploadError(f"Chunk at offset {offset} failed after {max_retries + 1} attempts: {error}")
+
+
+class UploadResult(NamedTuple):
+    file_path: str
+    success: bool
+    size: int
+    seconds: float
+
+
+def collect_files(paths: List[str]) -> Dict[str, str]:
+    """
+    Expand directories into the files below them.
+
+    Args:
+        paths: Files and directories to upload
+
+    Returns:
+        Each file's path mapped to its name: the path relative to the directory it
+        was found in, with "/" separators, or the base name for a file given
+        directly. Files come in the order given, each directory's files sorted and
+        without hidden files or directories. Paths that don't exist are kept, so
+        they are reported as failed uploads.
+    """
+    files: Dict[str, str] = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+                for name in sorted(names):
+                    if not name.startswith("."):
+                        file_path = os.path.join(root, name)
+                        files.setdefault(file_path, os.path.relpath(file_path, path).replace(os.sep, "/"))
+        else:
+            files.setdefault(path, os.path.basename(path))
+    return files
+
+
+class UploadManifest:
+    """
+    Local record of the content hash of every file uploaded to an endpoint.
+
+    Files are identified by endpoint URL, user ID and the name collect_files gives
+    them, their path below the directory being uploaded, so that day partitions
+    with the same file name in different directories don't share an entry. A file
+    whose hash matches its last successful upload does not have to be sent again.
+    Stored as JSON: {endpoint_url: {user_id: {name: sha256}}}.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__entries: Dict[str, Dict[str, Dict[str, str]]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.__entries = json.load(f)
+
+    def is_uploaded(self, endpoint_url: str, user_id: str, name: str, sha256: str) -> bool:
+        """
+        Check whether this content was already uploaded under the file's name.
+
+        Args:
+            endpoint_url: URL endpoint the file goes to
+            user_id: User ID the file is uploaded for
+            name: Name of the file, as returned by collect_files
+            sha256: Hex SHA-256 of the file's contents
+
+        Returns:
+            True if the last successful upload of the file had the same hash
+        """
+        uploaded = self.__entries.get(endpoint_url, {}).get(user_id, {})
+        return uploaded.get(name) == sha256
+
+    def record(self, endpoint_url: str, user_id: str, name: str, sha256: str) -> None:
+        """
+        Remember a successful upload.
+
+        Args:
+            endpoint_url: URL endpoint the file was sent to
+            user_id: User ID the file was uploaded for
+            name: Name of the file, as returned by collect_files
+            sha256: Hex SHA-256 of the uploaded contents
+        """
+        uploaded = self.__entries.setdefault(endpoint_url, {}).setdefault(user_id, {})
+        uploaded[name] = sha256
+
+    def save(self) -> None:
+        """Write the manifest, replacing the previous version only once it is complete."""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.__entries, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+def upload_files(
+    file_paths: List[str],
+    endpoint_url: str,
+    user_id: str,
+    auth_key: Optional[str] = None,
+    verbose: bool = False,
+    concurrency: int = CONCURRENCY,
+    resumable: bool = False,
+    **options: Any
+) -> List[UploadResult]:
+    """
+    Upload several files at a time over one pooled keep-alive session.
+
+    Args:
+        file_paths: Paths of the files to upload
+        endpoint_url: URL endpoint to send the files to
+        user_id: User ID for authentication
+        auth_key: Optional authentication key
+        verbose: Enable verbose output
+        concurrency: How many files to upload at the same time
+        resumable: Use upload_file_resumable instead of upload_file
+        **options: Further arguments for the upload function, e.g. compression
+
+    Returns:
+        One result per file, in the order of file_paths
+    """
+    upload = upload_file_resumable if resumable else upload_file
+
+    with create_session(concurrency) as session:
+        def run(file_path: str) -> UploadResult:
+            started = time.monotonic()
+            try:
+                success = upload(file_path, endpoint_url, user_id, auth_key, verbose, session=session, **options)
+            except Exception as e:
+                print(f"Error uploading {file_path}: {e}")
+                success = False
+            size = os.path.getsize(file_path) if os.path.isfile(file_path) else 0
+            return UploadResult(file_path, success, size, time.monotonic() - started)
+
+        if concurrency <= 1 or len(file_paths) <= 1:
+            return [run(file_path) for file_path in file_paths]
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(run, file_paths))
+
+
+def print_summary(results: List[UploadResult], elapsed: float) -> None:
+    """
+    Print one line per uploaded file and the totals.
+
+    Args:
+        results: Results of upload_files
+        elapsed: Seconds all uploads took together
+    """
+    for result in results:
+        status = "OK" if result.success else "FAILED"
+        print(f"  {status:<6} {result.file_path} ({result.size / 2**20:.1f} MiB, {result.seconds:.1f}s)")
+    uploaded = [result for result in results if result.success]
+    total = sum(result.size for result in uploaded)
+    print(
+        f"Uploaded {len(uploaded)} of {len(results)} files, {total / 2**20:.1f} MiB in {elapsed:.1f}s "
+        f"({total / 2**20 / max(elapsed, 1e-6):.1f} MiB/s)"
+    )
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
-        description="Upload a file to a specified endpoint",
+        description="Upload files to a specified endpoint",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
@@ -75,12 +848,27 @@ Examples:
 
   # Verbose output
   %(prog)s commits_2024-01-01_to_2024-12-31.xlsx -u https://api.example.com/upload -i USER_ID -k YOUR_API_KEY -v
+
+  # Compress the request body on the fly
+  %(prog)s commits_2024-01-01_to_2024-12-31.csv -u https://api.example.com/upload -i USER_ID -k YOUR_API_KEY -c gzip
+
+  # Every file in a directory, 8 at a time
+  %(prog)s shards/ -u https://api.example.com/upload -i USER_ID -k YOUR_API_KEY -j 8
+
+  # Only send the partitions that changed since the last run
+  %(prog)s partitions/ -u https://api.example.com/upload -i USER_ID -k YOUR_API_KEY --manifest uploads.json
+
+  # Resumable upload in 16 MiB chunks, retrying each request up to 8 times
+  %(prog)s commits_2024-01-01_to_2024-12-31.csv -u https://api.example.com/upload -i USER_ID -k YOUR_API_KEY \\
+    --resumable --chunk-size 16 --retries 8
         """
     )
 
     parser.add_argument(
-        "file",
-        help="Path to the file to upload"
+        "files",
+        nargs="+",
+        metavar="PATH",
+        help="Files to upload; directories are uploaded with every file below them"
     )
 
     parser.add_argument(
@@ -101,6 +889,50 @@ Examples:
         help="Authentication key (will be sent as 'X-API-Key' header)"
     )
 
+    parser.add_argument(
+        "-c", "--compression",
+        choices=COMPRESSIONS,
+        help="Compress the request body and send it with this Content-Encoding (zstd requires zstandard)"
+    )
+
+    parser.add_argument(
+        "-j", "--concurrency",
+        type=int,
+        default=CONCURRENCY,
+        metavar="N",
+        help=f"Number of files to upload at the same time over shared connections (default: {CONCURRENCY})"
+    )
+
+    parser.add_argument(
+        "--resumable",
+        action="store_true",
+        help="Upload in acknowledged chunks that are retried and resumed after failures "
+             "(the endpoint must support the resumable protocol)"
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=RESUMABLE_CHUNK_SIZE >> 20,
+        metavar="MIB",
+        help=f"Chunk size in MiB for --resumable (default: {RESUMABLE_CHUNK_SIZE >> 20})"
+    )
+
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=MAX_RETRIES,
+        metavar="N",
+        help=f"Retries per request for --resumable, with exponential backoff (default: {MAX_RETRIES})"
+    )
+
+    parser.add_argument(
+        "--manifest",
+        metavar="FILE",
+        help="JSON file with the SHA-256 of every file uploaded so far; files whose content "
+             "did not change since their last upload are skipped"
+    )
+
     parser.add_argument(
         "-v", "--verbose",
         action="store_true",
@@ -109,15 +941,64 @@ Examples:
 
     args = parser.parse_args()
 
-    success = upload_file(
-        file_path=args.file,
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    if args.retries < 0:
+        parser.error("--retries can't be negative")
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    names = collect_files(args.files)
+    file_paths = list(names)
+    if not file_paths:
+        print("Error: No files to upload.")
+        sys.exit(1)
+
+    manifest: Optional[UploadManifest] = None
+    hashes: Dict[str, str] = {}
+    if args.manifest:
+        try:
+            manifest = UploadManifest(args.manifest)
+        except (OSError, ValueError) as e:
+            print(f"Error: Invalid manifest {args.manifest}: {e}")
+            sys.exit(1)
+
+        # Missing files are left in, so they are reported as failed uploads
+        hashes = {path: file_sha256(path) for path in file_paths if os.path.isfile(path)}
+        changed = [
+            path for path in file_paths
+            if path not in hashes or not manifest.is_uploaded(args.url, args.user_id, names[path], hashes[path])
+        ]
+        print(f"Skipping {len(file_paths) - len(changed)} of {len(file_paths)} files already uploaded unchanged")
+        file_paths = changed
+
+    options: Dict[str, Any] = {"compression": args.compression}
+    if args.resumable:
+        options.update(chunk_size=args.chunk_size << 20, max_retries=args.retries)
+
+    started = time.monotonic()
+    results = upload_files(
+        file_paths,
         endpoint_url=args.url,
         user_id=args.user_id,
         auth_key=args.key,
-        verbose=args.verbose
+        verbose=args.verbose,
+        concurrency=args.concurrency,
+        resumable=args.resumable,
+        **options
     )
+    if len(results) > 1:
+        print_summary(results, time.monotonic() - started)
+
+    if manifest is not None:
+        for result in results:
+            if result.success:
+                manifest.record(args.url, args.user_id, names[result.file_path], hashes[result.file_path])
+        manifest.save()
 
-    sys.exit(0 if success else 1)
+    sys.exit(0 if all(result.success for result in results) else 1)
 
 
 if __name__ == "__main__":
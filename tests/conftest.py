@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import pytest
+
+# The scripts are run directly rather than installed, so import them from scripts/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+# (committer date as local time, author email, {path: new contents, or None to delete})
+Commit = Tuple[str, str, Dict[str, str | None]]
+
+
+def git(repo: Path, *args: str, env: Dict[str, str] | None = None) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=repo, env={**os.environ, **(env or {})}, check=True, capture_output=True, text=True
+    ).stdout
+
+
+@pytest.fixture
+def make_repo() -> Callable[[Path, List[Commit]], Path]:
+    # Builds a repository with one commit per entry, in order
+    def make(path: Path, commits: List[Commit]) -> Path:
+        path.mkdir(parents=True)
+        git(path, "init", "-q", "-b", "main")
+        for when, author, files in commits:
+            for name, contents in files.items():
+                file_path = path / name
+                if contents is None:
+                    file_path.unlink()
+                else:
+                    file_path.parent.mkdir(parents=True, exist_ok=True)
+                    file_path.write_text(contents)
+            git(path, "add", "-A")
+            git(path, "commit", "-q", "-m", f"Commit at {when}", env={
+                "GIT_AUTHOR_NAME": author.split("@")[0],
+                "GIT_AUTHOR_EMAIL": author,
+                "GIT_AUTHOR_DATE": when,
+                "GIT_COMMITTER_NAME": author.split("@")[0],
+                "GIT_COMMITTER_EMAIL": author,
+                "GIT_COMMITTER_DATE": when,
+            })
+        return path
+
+    return make
@@ -0,0 +1,61 @@
+import csv
+from collections import defaultdict
+from datetime import date
+
+import pytest
+
+from canaicode_git_extractor import AGGREGATE_TABLES, AggregatingSink, CsvSink, GitRepoConsumer
+
+TOTALS = ("commits", "files", "added_lines", "removed_lines")
+
+# Several commits per day and author, commits touching several files of one
+# language, edits and deletions
+COMMITS = [
+    ("2024-01-02T09:00:00", "ana@example.com", {"app.py": "a\nb\nc\n", "lib/util.py": "x\n", "web/index.js": "1\n2\n"}),
+    ("2024-01-02T11:00:00", "ana@example.com", {"app.py": "a\nB\nc\nd\n", "README.md": "hi\n"}),
+    ("2024-01-02T15:00:00", "bo@example.com", {"lib/util.py": "x\ny\nz\n", "web/index.js": "1\n"}),
+    ("2024-01-03T10:00:00", "bo@example.com", {"lib/more.py": "m\n" * 5, "web/app.ts": "t\n" * 3}),
+    ("2024-01-03T16:00:00", "ana@example.com", {"lib/util.py": None, "app.py": "a\n"}),
+    ("2024-01-05T12:00:00", "cy@example.com", {"web/index.js": "one\ntwo\nthree\n", "web/app.ts": None}),
+]
+START = date(2024, 1, 1)
+END = date(2024, 1, 31)
+
+
+@pytest.mark.parametrize("mode", list(AGGREGATE_TABLES))
+def test_aggregated_totals_equal_sums_of_raw_rows(tmp_path, make_repo, mode):
+    table = AGGREGATE_TABLES[mode]
+    consumer = GitRepoConsumer(str(make_repo(tmp_path / "repo", COMMITS)))
+    try:
+        flat = consumer.get_rows_in_range(START, END)
+        sink = AggregatingSink(CsvSink(str(tmp_path / "aggregated.csv"), table))
+        consumer.export_commits_in_range(START, END, sink)
+        sink.close()
+    finally:
+        consumer.close()
+
+    with open(tmp_path / "aggregated.csv", newline="", encoding="utf-8") as f:
+        aggregated = list(csv.DictReader(f))
+
+    # Group the raw rows the way the mode does, with keys as they appear in the CSV
+    key_columns = [column for column in table.columns if column not in TOTALS]
+    expected = defaultdict(lambda: {"hashes": set(), "files": 0, "added_lines": 0, "removed_lines": 0})
+    for row in flat:
+        group = expected[tuple(str(getattr(row, column)) for column in key_columns)]
+        group["hashes"].add(row.hash)
+        group["files"] += 1
+        group["added_lines"] += row.added_lines
+        group["removed_lines"] += row.removed_lines
+
+    assert len(aggregated) == len(expected) < len(flat)
+    for output_row in aggregated:
+        group = expected[tuple(output_row[column] for column in key_columns)]
+        assert int(output_row["files"]) == group["files"]
+        assert int(output_row["added_lines"]) == group["added_lines"]
+        assert int(output_row["removed_lines"]) == group["removed_lines"]
+        if "commits" in table.columns:
+            assert int(output_row["commits"]) == len(group["hashes"])
+
+    for total in ("added_lines", "removed_lines"):
+        assert sum(int(row[total]) for row in aggregated) == sum(getattr(row, total) for row in flat)
+    assert sum(int(row["files"]) for row in aggregated) == len(flat)
@@ -0,0 +1,107 @@
+from datetime import date
+
+import pytest
+
+import canaicode_git_extractor
+from canaicode_git_extractor import clone_repository, process_repository
+from conftest import git
+
+START = date(2024, 3, 1)
+END = date(2024, 3, 31)
+
+
+def commit(path, when, files):
+    for name, contents in files.items():
+        (path / name).write_text(contents)
+    git(path, "add", "-A")
+    git(path, "commit", "-q", "-m", f"Commit at {when}", env={
+        "GIT_AUTHOR_NAME": "cy", "GIT_AUTHOR_EMAIL": "cy@example.com", "GIT_AUTHOR_DATE": when,
+        "GIT_COMMITTER_NAME": "cy", "GIT_COMMITTER_EMAIL": "cy@example.com", "GIT_COMMITTER_DATE": when,
+    })
+
+
+@pytest.fixture
+def remote(tmp_path, make_repo):
+    # History well before the window, window commits whose first parent is older
+    # than the shallow boundary (on main and on a side branch), a window merge of a
+    # since deleted topic branch into another old branch, and a commit after the window
+    path = make_repo(tmp_path / "remote", [
+        ("2023-01-10T12:00:00", "ana@example.com", {"a.py": "".join(f"line {i}\n" for i in range(100)), "b.js": "b\n"}),
+        ("2023-06-01T12:00:00", "bo@example.com", {"a.py": "".join(f"line {i}\n" for i in range(90))}),
+    ])
+    git(path, "branch", "feature")
+    git(path, "branch", "release")
+    git(path, "branch", "topic")
+    commit(path, "2024-03-10T12:00:00", {"a.py": "new\n" + "".join(f"line {i}\n" for i in range(1, 92))})
+    commit(path, "2024-03-12T12:00:00", {"c.go": "package main\n\nfunc main() {}\n"})
+    commit(path, "2024-04-05T12:00:00", {"c.go": "package main\n"})
+    git(path, "checkout", "-q", "feature")
+    commit(path, "2024-03-15T12:00:00", {"b.js": "b\nc\nd\n"})
+    git(path, "checkout", "-q", "topic")
+    commit(path, "2024-03-18T12:00:00", {"d.rb": "puts 1\n"})
+    git(path, "checkout", "-q", "release")
+    git(path, "merge", "-q", "--no-ff", "topic", "-m", "Merge topic", env={
+        "GIT_AUTHOR_NAME": "cy", "GIT_AUTHOR_EMAIL": "cy@example.com", "GIT_AUTHOR_DATE": "2024-03-19T12:00:00",
+        "GIT_COMMITTER_NAME": "cy", "GIT_COMMITTER_EMAIL": "cy@example.com", "GIT_COMMITTER_DATE": "2024-03-19T12:00:00",
+    })
+    git(path, "checkout", "-q", "main")
+    git(path, "branch", "-q", "-D", "topic")
+    # Partial clones over file:// need the "server" to allow filters
+    git(path, "config", "uploadpack.allowFilter", "true")
+    return f"file://{path}"
+
+
+def test_shallow_and_partial_clones_give_the_same_rows(remote):
+    results = {
+        (shallow, filter_blobs): process_repository(
+            remote, START, END, shallow_clone=shallow, filter_blobs=filter_blobs
+        )
+        for shallow, filter_blobs in [(False, False), (True, False), (True, True)]
+    }
+
+    full = results[(False, False)].rows
+    assert {row.language for row in full} == {"Python", "Go", "JavaScript", "Ruby"}
+    # Diffed against the real parent, not the empty tree
+    assert [(row.added_lines, row.removed_lines) for row in full if row.language == "Python"] == [(3, 1)]
+    for result in results.values():
+        assert result.rows == full
+
+
+def test_shallow_clone_stops_near_the_window(remote, tmp_path):
+    assert clone_repository(remote, str(tmp_path / "shallow.git"), START, filter_blobs=True)
+
+    # The boundary was deepened to the commits just before the window, not to the root
+    commits = git(tmp_path / "shallow.git", "rev-list", "--all").split()
+    assert 0 < len(commits) < int(git(tmp_path / "remote", "rev-list", "--all", "--count"))
+    assert (tmp_path / "shallow.git" / "shallow").exists()
+    assert git(tmp_path / "shallow.git", "config", "remote.origin.partialclonefilter").strip() == "blob:none"
+
+
+def test_shallow_clone_without_window_commits(remote, tmp_path):
+    assert not clone_repository(remote, str(tmp_path / "empty.git"), date(2025, 1, 1))
+
+
+def test_unchanged_remote_is_skipped_without_fetching(remote, tmp_path, monkeypatch):
+    first = process_repository(remote, START, END, skip_unchanged=True)
+    assert not first.skipped
+    assert first.checkpoint.fingerprint is not None
+
+    def no_clone(*args, **kwargs):
+        raise AssertionError("unchanged remote was cloned")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(canaicode_git_extractor, "clone_repository", no_clone)
+        second = process_repository(remote, START, END, checkpoint=first.checkpoint, skip_unchanged=True)
+    assert second.skipped
+    assert second.rows == []
+    assert second.checkpoint == first.checkpoint
+
+    # A pushed ref changes the fingerprint, so the next run clones and extracts again
+    git(tmp_path / "remote", "checkout", "-q", "-b", "hotfix", "feature")
+    commit(tmp_path / "remote", "2024-03-20T12:00:00", {"e.rs": "fn main() {}\n"})
+    git(tmp_path / "remote", "checkout", "-q", "main")
+    third = process_repository(remote, START, END, checkpoint=second.checkpoint, skip_unchanged=True)
+
+    assert not third.skipped
+    assert [row.language for row in third.rows] == ["Rust"]
+    assert third.checkpoint.fingerprint != first.checkpoint.fingerprint
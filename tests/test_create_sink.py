@@ -0,0 +1,12 @@
+import pytest
+
+from canaicode_git_extractor import CsvSink, ExcelSink, JsonLinesSink, create_sink
+
+
+@pytest.mark.parametrize("output_format, sink_class", [("csv", CsvSink), ("jsonl", JsonLinesSink), ("xlsx", ExcelSink)])
+def test_compression_none_is_accepted_for_row_formats(tmp_path, output_format, sink_class):
+    path = str(tmp_path / f"out.{output_format}")
+
+    assert isinstance(create_sink(path, output_format, "none"), sink_class)
+    with pytest.raises(ValueError, match="only supported for parquet and arrow"):
+        create_sink(path, output_format, "zstd")
@@ -0,0 +1,44 @@
+import time
+from datetime import date
+
+from canaicode_git_extractor import GitRepoConsumer, extract_commits
+
+START = date(2024, 1, 1)
+END = date(2024, 1, 31)
+
+# Several commits on most days, each touching one to three files
+COMMITS = [
+    (
+        f"2024-01-{1 + i // 3:02d}T{8 + i % 3 * 4:02d}:00:00",
+        f"dev{i % 4}@example.com",
+        {f"src/file{(i + j) % 7}.{('py', 'js', 'go')[j]}": f"line {i}\n" * (i + j + 1) for j in range(1 + i % 3)},
+    )
+    for i in range(40)
+]
+
+
+def test_parallel_diffs_keep_serial_order(tmp_path, make_repo, monkeypatch):
+    repo = make_repo(tmp_path / "repo", COMMITS)
+    monkeypatch.setattr(GitRepoConsumer, "_GitRepoConsumer__MAX_BATCH_SIZE", 3)
+
+    # Of every four batches started, the earlier ones take longer, so with four
+    # workers later batches finish first
+    diff_batch = GitRepoConsumer._GitRepoConsumer__diff_batch
+    batches = []
+
+    def slow_diff_batch(self, commits):
+        batches.append(commits)
+        time.sleep(0.02 * (3 - (len(batches) - 1) % 4))
+        return diff_batch(self, commits)
+
+    monkeypatch.setattr(GitRepoConsumer, "_GitRepoConsumer__diff_batch", slow_diff_batch)
+
+    serial = extract_commits(str(repo), START, END, diff_workers=1).rows
+    assert len(batches) == 14
+    parallel = extract_commits(str(repo), START, END, diff_workers=4).rows
+
+    assert len(batches) == 28
+    assert len({row.hash for row in serial}) == len(COMMITS)
+    assert parallel == serial
+    # Days ascending
+    assert [row.date for row in serial] == sorted(row.date for row in serial)
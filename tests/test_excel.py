@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import pytest
+
+from canaicode_git_extractor import ExcelSink
+
+openpyxl = pytest.importorskip("openpyxl")
+
+
+def rows(repository, count):
+    return [
+        (f"{repository[:8]}{i:032x}", repository, datetime(2024, 1, 1 + i % 28), "ana@example.com", "Python", i, 1)
+        for i in range(count)
+    ]
+
+
+def test_sheets_continue_when_full(tmp_path, monkeypatch):
+    monkeypatch.setattr(ExcelSink, "_ExcelSink__MAX_DATA_ROWS", 3)
+    long_name = "a-repository-with-a-very-long-name"
+    written = {"repo": rows("repo", 7), "other": rows("other", 2), long_name: rows(long_name, 4)}
+
+    sink = ExcelSink(str(tmp_path / "out.xlsx"))
+    for repository, repository_rows in written.items():
+        sink.open_repository(repository)
+        # Several writes, as extraction sends one commit at a time
+        for i in range(0, len(repository_rows), 2):
+            sink.write(repository_rows[i:i + 2])
+    # A second repository with the same name gets the next free sheet
+    sink.open_repository("repo")
+    sink.write(rows("repo", 1))
+    sink.close()
+
+    workbook = openpyxl.load_workbook(tmp_path / "out.xlsx", read_only=True)
+    sheets = {sheet.title: [row for row in sheet.iter_rows(values_only=True)] for sheet in workbook.worksheets}
+    assert list(sheets) == [
+        "repo", "repo (2)", "repo (3)", "other", long_name[:31], f"{long_name[:27]} (2)", "repo (4)"
+    ]
+    assert [len(sheet) - 1 for sheet in sheets.values()] == [3, 3, 1, 2, 3, 1, 1]
+    for sheet in sheets.values():
+        assert sheet[0] == tuple(sink.columns)
+
+    # Every row is kept, in order
+    data = [row for sheet in sheets.values() for row in sheet[1:]]
+    expected = [*written["repo"], *written["other"], *written[long_name], *rows("repo", 1)]
+    assert [(row[0], row[1], row[5]) for row in data] == [(row[0], row[1], row[5]) for row in expected]
+    assert sink.rows_written == len(expected)
@@ -0,0 +1,65 @@
+from datetime import date
+
+import pytest
+from pydantic import ValidationError
+
+from canaicode_git_extractor import GitRepoConsumer, LanguageDetector, LanguageMap
+
+
+@pytest.mark.parametrize("path, language", [
+    ("src/app.py", "Python"),
+    # Exact file names win over extensions, case-insensitively
+    ("Dockerfile", "Dockerfile"),
+    ("build/makefile", "Makefile"),
+    ("CMakeLists.txt", "CMake"),
+    ("notes.txt", "Plain Text"),
+    # The longest known suffix wins
+    ("types/index.d.ts", "TypeScript"),
+    ("views/home.blade.php", "Blade"),
+    ("views/home.html.erb", "HTML+ERB"),
+    ("lib/archive.tar.py", "Python"),
+    # A leading dot marks a hidden file, not an extension
+    (".bashrc", "Shell"),
+    (".py", "Other"),
+    ("bin/tool", "Other"),
+])
+def test_detect_from_path(path, language):
+    assert LanguageDetector().detect(path) == language
+
+
+def test_language_map_adds_and_overrides_entries():
+    detector = LanguageDetector(LanguageMap(
+        extensions={".PY": "Snake", ".tpl": "Template"}, filenames={"BUILD": "Starlark"},
+    ))
+
+    assert detector.detect("app.py") == "Snake"
+    assert detector.detect("page.tpl") == "Template"
+    assert detector.detect("pkg/build") == "Starlark"
+    assert detector.detect("app.js") == "JavaScript"
+    with pytest.raises(ValidationError):
+        LanguageMap.model_validate({"extension": {".x": "X"}})
+
+
+def test_shebangs(tmp_path, make_repo):
+    repo = make_repo(tmp_path / "repo", [
+        ("2024-01-02T09:00:00", "ana@example.com", {
+            "bin/run": "#!/usr/bin/env -S PYTHONUNBUFFERED=1 python3.12 -u\nprint(1)\n",
+            "bin/serve": "#!/usr/bin/node\nmain()\n",
+            "bin/plain": "no shebang\n",
+            "bin/same-as-run": "#!/usr/bin/env -S PYTHONUNBUFFERED=1 python3.12 -u\nprint(1)\n",
+        }),
+        # A deleted file is sniffed as of the parent commit
+        ("2024-01-03T09:00:00", "ana@example.com", {"bin/serve": None}),
+    ])
+
+    languages = {}
+    for detect_shebangs in (False, True):
+        consumer = GitRepoConsumer(str(repo), language_detector=LanguageDetector(detect_shebangs=detect_shebangs))
+        try:
+            rows = consumer.get_rows_in_range(date(2024, 1, 1), date(2024, 1, 31))
+        finally:
+            consumer.close()
+        languages[detect_shebangs] = sorted((row.date.day, row.language) for row in rows)
+
+    assert languages[False] == [(2, "Other")] * 4 + [(3, "Other")]
+    assert languages[True] == [(2, "JavaScript"), (2, "Other"), (2, "Python"), (2, "Python"), (3, "JavaScript")]
@@ -0,0 +1,71 @@
+from datetime import date
+
+import pytest
+
+from canaicode_git_extractor import GitRepoConsumer, MetricsCache, PathFilter
+
+COMMITS = [
+    ("2024-01-02T09:00:00", "ana@example.com", {"app.py": "a\nb\n", "web/index.js": "1\n"}),
+    ("2024-01-03T15:00:00", "bo@example.com", {"app.py": "a\n", "web/index.js": "1\n2\n"}),
+    ("2024-01-04T10:00:00", "bo@example.com", {"lib.py": "x\ny\n"}),
+]
+START = date(2024, 1, 1)
+END = date(2024, 1, 31)
+
+
+def extract(repo, cache_path, path_filter=None, diff_workers=1):
+    cache = MetricsCache(str(cache_path))
+    consumer = GitRepoConsumer(str(repo), diff_workers, cache, path_filter=path_filter)
+    try:
+        return consumer.get_rows_in_range(START, END), (cache.hits, cache.misses)
+    finally:
+        consumer.close()
+        cache.close()
+
+
+@pytest.mark.parametrize("diff_workers", [1, 2])
+def test_second_run_reads_numstat_from_cache(tmp_path, make_repo, monkeypatch, diff_workers):
+    repo = make_repo(tmp_path / "repo", COMMITS)
+    cache_path = tmp_path / "cache" / "metrics.sqlite"
+
+    rows, counts = extract(repo, cache_path, diff_workers=diff_workers)
+    assert counts == (0, len(COMMITS))
+
+    # Nothing is diffed on the second run
+    def no_diff(self, commits):
+        raise AssertionError(f"diffed {len(commits)} commits")
+
+    monkeypatch.setattr(GitRepoConsumer, "_GitRepoConsumer__diff_batch", no_diff)
+    cached_rows, counts = extract(repo, cache_path, diff_workers=diff_workers)
+    assert counts == (len(COMMITS), 0)
+    assert cached_rows == rows
+
+
+def test_path_filters_use_their_own_entries(tmp_path, make_repo):
+    repo = make_repo(tmp_path / "repo", COMMITS)
+    cache_path = tmp_path / "metrics.sqlite"
+    python_only = PathFilter(include=["*.py"])
+
+    rows, _ = extract(repo, cache_path)
+    filtered, counts = extract(repo, cache_path, python_only)
+    assert counts == (0, len(COMMITS))
+    assert filtered == [row for row in rows if row.language == "Python"]
+
+    # Each scope hits its own entries from then on
+    assert extract(repo, cache_path, python_only) == (filtered, (len(COMMITS), 0))
+    assert extract(repo, cache_path, PathFilter(exclude=["web"])) == (filtered, (0, len(COMMITS)))
+    assert extract(repo, cache_path) == (rows, (len(COMMITS), 0))
+
+
+def test_entries_are_keyed_by_commit_and_first_parent(tmp_path):
+    cache = MetricsCache(str(tmp_path / "metrics.sqlite"))
+    try:
+        cache.put_many({("c1", "p1"): [(1, 2, "a.py")]})
+        cache.put_many({("c1", "p1"): [(3, 4, "b.py")]}, scope="filtered")
+
+        assert cache.get_many([("c1", "p1"), ("c1", "p2"), ("c2", "p1")]) == {("c1", "p1"): [(1, 2, "a.py")]}
+        assert cache.get_many([("c1", "p1")], scope="filtered") == {("c1", "p1"): [(3, 4, "b.py")]}
+        assert cache.get_many([("c1", "p1")], scope="other") == {}
+        assert (cache.hits, cache.misses) == (2, 3)
+    finally:
+        cache.close()
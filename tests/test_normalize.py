@@ -0,0 +1,36 @@
+import sys
+
+import pandas as pd
+
+import canaicode_git_extractor
+
+COMMITS = [
+    ("2024-01-02T09:00:00", "ana@example.com", {"app.py": "a\nb\n", "web/index.js": "1\n", "README.md": "hi\n"}),
+    ("2024-01-02T15:00:00", "bo@example.com", {"app.py": "a\n"}),
+    ("2024-01-04T10:00:00", "bo@example.com", {"lib.py": "x\ny\n", "web/index.js": None}),
+]
+OTHER_COMMITS = [
+    ("2024-01-03T11:00:00", "cy@example.com", {"main.go": "package main\n", "go.mod": "module x\n"}),
+]
+
+
+def test_normalized_tables_join_back_to_flat_export(tmp_path, make_repo, monkeypatch):
+    repos = [make_repo(tmp_path / "repo", COMMITS), make_repo(tmp_path / "other", OTHER_COMMITS)]
+    (tmp_path / "repos.txt").write_text("".join(f"{repo}\n" for repo in repos))
+    argv = ["extractor", "-f", str(tmp_path / "repos.txt"), "-s", "2024-01-01", "-e", "2024-01-31"]
+
+    monkeypatch.setattr(sys, "argv", [*argv, "-o", str(tmp_path / "flat.csv")])
+    canaicode_git_extractor.main()
+    monkeypatch.setattr(sys, "argv", [*argv, "-o", str(tmp_path / "normalized.csv"), "--normalize"])
+    canaicode_git_extractor.main()
+
+    flat = pd.read_csv(tmp_path / "flat.csv", dtype=str)
+    commits = pd.read_csv(tmp_path / "normalized_commits.csv", dtype=str)
+    file_changes = pd.read_csv(tmp_path / "normalized_file_changes.csv", dtype=str)
+
+    assert len(flat) == 8
+    # Each commit once, numbered across repositories
+    assert list(commits["commit_id"]) == [str(i) for i in range(1, len(COMMITS) + len(OTHER_COMMITS) + 1)]
+    assert commits["hash"].is_unique
+    joined = file_changes.merge(commits, on="commit_id", how="left", validate="many_to_one")
+    pd.testing.assert_frame_equal(joined[list(flat.columns)], flat)
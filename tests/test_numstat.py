@@ -0,0 +1,71 @@
+from datetime import date
+
+import pytest
+
+from canaicode_git_extractor import GitRepoConsumer
+from conftest import git
+
+START = date(2024, 1, 1)
+END = date(2024, 1, 31)
+
+
+@pytest.fixture
+def repo(tmp_path, make_repo):
+    # Paths with spaces, tabs, non-ASCII characters and newlines, then a rename
+    # with an edit and a binary file
+    path = make_repo(tmp_path / "repo", [
+        ("2024-01-02T09:00:00", "ana@example.com", {
+            "a b.py": "".join(f"line {i}\n" for i in range(10)),
+            "tab\tname.js": "1\n2\n",
+            "ünï.go": "package main\n",
+            "new\nline.rb": "puts 1\n",
+        }),
+    ])
+    (path / "src").mkdir()
+    git(path, "mv", "a b.py", "src/moved.ts")
+    (path / "src" / "moved.ts").write_text("".join(f"line {i}\n" for i in range(9)) + "changed\n")
+    (path / "logo.png").write_bytes(bytes(range(256)) * 4)
+    git(path, "add", "-A")
+    git(path, "commit", "-q", "-m", "Move and add a binary", env={
+        "GIT_AUTHOR_NAME": "bo", "GIT_AUTHOR_EMAIL": "bo@example.com", "GIT_AUTHOR_DATE": "2024-01-03T09:00:00",
+        "GIT_COMMITTER_NAME": "bo", "GIT_COMMITTER_EMAIL": "bo@example.com",
+        "GIT_COMMITTER_DATE": "2024-01-03T09:00:00",
+    })
+    return path
+
+
+def changes_by_day(rows):
+    changes = {}
+    for row in rows:
+        changes.setdefault(row.date.day, []).append((row.language, row.added_lines, row.removed_lines))
+    return {day: sorted(day_changes) for day, day_changes in changes.items()}
+
+
+def test_numstat_edge_cases(repo):
+    consumer = GitRepoConsumer(str(repo))
+    try:
+        rows = consumer.get_rows_in_range(START, END)
+    finally:
+        consumer.close()
+
+    assert changes_by_day(rows) == {
+        2: [("Go", 1, 0), ("JavaScript", 2, 0), ("Python", 10, 0), ("Ruby", 1, 0)],
+        # The rename is classified by its new path; binary files count as 0 lines
+        3: [("Other", 0, 0), ("TypeScript", 1, 1)],
+    }
+
+
+def test_tokens_split_across_read_blocks(repo, monkeypatch):
+    consumer = GitRepoConsumer(str(repo))
+    try:
+        expected = consumer.get_rows_in_range(START, END)
+    finally:
+        consumer.close()
+
+    # Every token, and the NUL after it, ends up split between reads
+    monkeypatch.setattr(GitRepoConsumer, "_GitRepoConsumer__READ_SIZE", 3)
+    consumer = GitRepoConsumer(str(repo))
+    try:
+        assert consumer.get_rows_in_range(START, END) == expected
+    finally:
+        consumer.close()
@@ -0,0 +1,57 @@
+import csv
+from datetime import date, datetime
+
+import pytest
+
+from canaicode_git_extractor import CsvSink, GitRepoConsumer, PartitionedSink
+
+COMMITS = [
+    ("2024-01-02T09:00:00", "ana@example.com", {"app.py": "a\nb\n", "web/index.js": "1\n"}),
+    ("2024-01-02T15:00:00", "bo@example.com", {"app.py": "a\n"}),
+    ("2024-01-04T10:00:00", "bo@example.com", {"lib.py": "x\ny\n"}),
+    ("2024-01-05T12:00:00", "ana@example.com", {"web/index.js": "1\n2\n", "lib.py": None}),
+    ("2024-01-05T18:00:00", "cy@example.com", {"app.py": "a\nc\n"}),
+]
+START = date(2024, 1, 1)
+END = date(2024, 1, 31)
+
+
+def test_one_partition_per_day(tmp_path, make_repo):
+    open_partitions = []
+
+    class TrackedCsvSink(CsvSink):
+        # Records how many partitions are open at once
+        def __init__(self, path, table):
+            super().__init__(path, table)
+            open_partitions.append(self)
+            assert len(open_partitions) == 1
+
+        def close(self):
+            super().close()
+            open_partitions.remove(self)
+
+    consumer = GitRepoConsumer(str(make_repo(tmp_path / "repo", COMMITS)))
+    try:
+        flat = consumer.get_rows_in_range(START, END)
+        sink = PartitionedSink(str(tmp_path / "out"), ".csv", TrackedCsvSink)
+        consumer.export_commits_in_range(START, END, sink)
+        sink.close()
+    finally:
+        consumer.close()
+
+    assert not open_partitions
+    days = sorted({row.date.strftime("%Y-%m-%d") for row in flat})
+    assert sink.paths == [str(tmp_path / "out" / f"repo_{day}.csv") for day in days]
+    for day, path in zip(days, sink.paths):
+        with open(path, newline="", encoding="utf-8") as f:
+            hashes = [row["hash"] for row in csv.DictReader(f)]
+        assert hashes == [row.hash for row in flat if row.date.strftime("%Y-%m-%d") == day]
+
+
+def test_day_out_of_order_is_rejected(tmp_path):
+    sink = PartitionedSink(str(tmp_path / "out"), ".csv", CsvSink)
+    sink.open_repository("repo")
+    sink.write([("a", "repo", datetime(2024, 1, 5, 12), "ana@example.com", "Python", 1, 0)])
+    with pytest.raises(ValueError):
+        sink.write([("b", "repo", datetime(2024, 1, 2, 12), "ana@example.com", "Python", 1, 0)])
+    sink.close()
@@ -0,0 +1,55 @@
+import tempfile
+from datetime import date
+
+import pytest
+
+from canaicode_git_extractor import GitRepoConsumer, PathFilter, extract_commits
+from conftest import git
+
+START = date(2024, 1, 1)
+END = date(2024, 1, 31)
+
+COMMITS = [
+    ("2024-01-02T09:00:00", "ana@example.com", {
+        ".gitattributes": "gen.py linguist-generated\n",
+        "gen.py": "a\n",
+        "src.py": "b\n",
+        "vendor/lib.py": "c\n",
+    }),
+    # Each file gains a different number of lines, so rows tell them apart
+    ("2024-01-03T09:00:00", "ana@example.com", {"gen.py": "a\n" * 2, "src.py": "b\n" * 3, "vendor/lib.py": "c\n" * 4}),
+]
+
+
+@pytest.mark.parametrize("bare", [False, True])
+def test_generated_files_follow_gitattributes_at_head(tmp_path, make_repo, bare):
+    path = make_repo(tmp_path / "repo", COMMITS)
+    # Uncommitted rules in the work tree must not change what is counted
+    (path / ".gitattributes").write_text("vendor/** linguist-vendored\n")
+    if bare:
+        git(tmp_path, "clone", "-q", "--bare", str(path), "repo.git")
+        path = tmp_path / "repo.git"
+
+    consumer = GitRepoConsumer(str(path), path_filter=PathFilter(exclude_generated=True))
+    try:
+        rows = consumer.get_rows_in_range(START, END)
+    finally:
+        consumer.close()
+
+    # gen.py is left out and vendor/lib.py is not
+    edits = [row for row in rows if row.date.day == 3]
+    assert sorted(row.added_lines for row in edits) == [2, 3]
+
+
+def test_failed_extraction_removes_attributes_file(tmp_path, make_repo, monkeypatch):
+    make_repo(tmp_path / "repo", COMMITS)
+    git(tmp_path, "clone", "-q", "--bare", str(tmp_path / "repo"), "repo.git")
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+
+    def fail(self):
+        raise RuntimeError("refs unavailable")
+
+    monkeypatch.setattr(GitRepoConsumer, "get_ref_tips", fail)
+    with pytest.raises(RuntimeError):
+        extract_commits(str(tmp_path / "repo.git"), START, END, path_filter=PathFilter(exclude_generated=True))
+    assert not list(tmp_path.glob("canaicode-attributes-*"))
@@ -0,0 +1,37 @@
+from datetime import date, datetime
+
+from canaicode_git_extractor import CommitMetrics, CommitRow, GitRepoConsumer
+
+COMMITS = [
+    ("2024-01-02T09:00:00", "ana@example.com", {"app.py": "a\nb\n", "web/index.js": "1\n"}),
+    ("2024-01-02T15:00:00", "bo@example.com", {"app.py": "a\n"}),
+    ("2024-01-04T10:00:00", "bo@example.com", {"lib.py": "x\ny\n", "web/index.js": None}),
+]
+START = date(2024, 1, 1)
+END = date(2024, 1, 31)
+
+
+def test_public_api_matches_raw_rows(tmp_path, make_repo):
+    consumer = GitRepoConsumer(str(make_repo(tmp_path / "repo", COMMITS)))
+    try:
+        rows = consumer.get_rows_in_range(START, END)
+        commits = consumer.get_commits_in_range(START, END)
+        by_date = consumer.get_commits_by_date(date(2024, 1, 2))
+        frame = consumer.get_frame_in_range(START, END)
+    finally:
+        consumer.close()
+
+    assert all(isinstance(row, CommitRow) for row in rows)
+    assert all(isinstance(commit, CommitMetrics) for commit in commits)
+    assert [CommitRow(**commit.model_dump()) for commit in commits] == rows
+    assert [commit.model_dump() for commit in by_date] == [
+        row._asdict() for row in rows if row.date.date() == date(2024, 1, 2)
+    ]
+    assert [tuple(row) for row in frame.astype(object).itertuples(index=False)] == [tuple(row) for row in rows]
+
+    # Rows of one day share their datetime, set to the start of the day
+    assert {row.date for row in rows} == {datetime(2024, 1, 2), datetime(2024, 1, 4)}
+    assert {row.repository for row in rows} == {"repo"}
+    assert sorted((row.language, row.added_lines, row.removed_lines) for row in rows if row.date.day == 4) == [
+        ("JavaScript", 0, 1), ("Python", 2, 0)
+    ]
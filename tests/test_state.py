@@ -0,0 +1,107 @@
+import sys
+from datetime import date
+
+import pytest
+
+import canaicode_git_extractor
+from canaicode_git_extractor import CsvSink, ExtractionState, RepositoryCheckpoint, extract_commits
+from conftest import git
+
+START = date(2024, 1, 1)
+END = date(2024, 12, 31)
+
+
+def commit(path, when, files):
+    for name, contents in files.items():
+        (path / name).write_text(contents)
+    git(path, "add", "-A")
+    git(path, "commit", "-q", "-m", f"Commit at {when}", env={
+        "GIT_AUTHOR_NAME": "cy", "GIT_AUTHOR_EMAIL": "cy@example.com", "GIT_AUTHOR_DATE": when,
+        "GIT_COMMITTER_NAME": "cy", "GIT_COMMITTER_EMAIL": "cy@example.com", "GIT_COMMITTER_DATE": when,
+    })
+
+
+def head(path):
+    return git(path, "rev-parse", "HEAD").strip()
+
+
+@pytest.mark.parametrize("start, end, covered", [
+    (date(2024, 1, 1), date(2024, 1, 31), True),
+    (date(2024, 1, 10), date(2024, 1, 20), True),
+    # Days after the previous run can only hold new commits
+    (date(2024, 1, 1), date(2024, 3, 31), True),
+    (date(2023, 12, 1), date(2024, 1, 31), False),
+])
+def test_checkpoint_covers(start, end, covered):
+    checkpoint = RepositoryCheckpoint(
+        refs={}, start=date(2024, 1, 1), end=date(2024, 1, 31), extracted_on=date(2024, 1, 31)
+    )
+    assert checkpoint.covers(start, end) is covered
+
+
+def test_second_run_returns_only_new_commits(tmp_path, make_repo):
+    repo = make_repo(tmp_path / "repo", [
+        ("2024-01-05T12:00:00", "ana@example.com", {"a.py": "a\n"}),
+        ("2024-02-05T12:00:00", "bo@example.com", {"b.py": "b\n"}),
+    ])
+    first = extract_commits(str(repo), START, END)
+    assert len(first.rows) == 2
+    assert first.checkpoint.refs == {"refs/heads/main": head(repo), "HEAD": head(repo)}
+
+    # New commits on main and on a new branch, dated inside the window
+    commit(repo, "2024-03-05T12:00:00", {"c.py": "c\n"})
+    new_on_main = head(repo)
+    git(repo, "checkout", "-q", "-b", "feature", "HEAD~2")
+    commit(repo, "2024-01-20T12:00:00", {"d.py": "d\n"})
+    new_on_feature = head(repo)
+
+    second = extract_commits(str(repo), START, END, checkpoint=first.checkpoint)
+
+    assert sorted(row.hash for row in second.rows) == sorted([new_on_main, new_on_feature])
+    assert second.checkpoint.refs["refs/heads/feature"] == new_on_feature
+
+
+def test_window_past_previous_run_walks_full_history(tmp_path, make_repo):
+    repo = make_repo(tmp_path / "repo", [
+        ("2024-01-05T12:00:00", "ana@example.com", {"a.py": "a\n"}),
+        ("2024-02-05T12:00:00", "bo@example.com", {"b.py": "b\n"}),
+    ])
+    # The first run only extracted January, but ran on February 10th, so the
+    # February commit was already reachable from the tips it recorded
+    january = extract_commits(str(repo), date(2024, 1, 1), date(2024, 1, 31))
+    checkpoint = january.checkpoint.model_copy(update={"extracted_on": date(2024, 2, 10)})
+    assert [row.date.month for row in january.rows] == [1]
+
+    rows = extract_commits(str(repo), date(2024, 1, 1), date(2024, 3, 31), checkpoint=checkpoint).rows
+
+    assert rows == extract_commits(str(repo), date(2024, 1, 1), date(2024, 3, 31)).rows
+    assert sorted(row.date.month for row in rows) == [1, 2]
+
+
+def test_failed_run_leaves_state_file_unchanged(tmp_path, make_repo, monkeypatch):
+    repo = make_repo(tmp_path / "repo", [("2024-01-05T12:00:00", "ana@example.com", {"a.py": "a\n"})])
+    state_file = tmp_path / "state.json"
+    argv = ["extractor", str(repo), "-s", str(START), "-e", str(END), "--state-file", str(state_file)]
+
+    monkeypatch.setattr(sys, "argv", [*argv, "-o", str(tmp_path / "first.csv")])
+    canaicode_git_extractor.main()
+    saved = state_file.read_bytes()
+    assert ExtractionState.load(str(state_file)).repositories[str(repo)].refs["HEAD"] == head(repo)
+
+    # The second run writes the first new commit, then fails on the next
+    commit(repo, "2024-02-05T12:00:00", {"b.py": "b\n"})
+    commit(repo, "2024-03-05T12:00:00", {"c.py": "c\n"})
+    write_rows = CsvSink._write_rows
+
+    def fail_after_first_write(self, rows):
+        if self.rows_written:
+            raise OSError("disk full")
+        write_rows(self, rows)
+
+    monkeypatch.setattr(CsvSink, "_write_rows", fail_after_first_write)
+    monkeypatch.setattr(sys, "argv", [*argv, "-o", str(tmp_path / "second.csv")])
+    with pytest.raises(SystemExit) as exit_info:
+        canaicode_git_extractor.main()
+
+    assert exit_info.value.code == 1
+    assert state_file.read_bytes() == saved
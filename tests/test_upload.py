@@ -0,0 +1,269 @@
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+# The upload client and the receiver need requests, which requirements.txt leaves out
+requests = pytest.importorskip("requests")
+
+import canaicode_git_extractor
+from local_receiver import ReceiverHandler, ResumableStore
+import upload_to_endpoint
+from upload_to_endpoint import collect_files, upload_file, upload_file_resumable, upload_files
+
+KEY = "test-key"
+
+
+class RecordingSession(requests.Session):
+    # Keeps every request's method and every response, so tests can look at what
+    # was attempted and what the receiver replied
+    def __init__(self):
+        super().__init__()
+        self.methods = []
+        self.responses = []
+
+    def request(self, method, url, *args, **kwargs):
+        self.methods.append(method)
+        response = super().request(method, url, *args, **kwargs)
+        self.responses.append(response)
+        return response
+
+
+@pytest.fixture
+def receiver(tmp_path):
+    # Starts local_receiver's handler on a free port and returns (upload URL, output directory)
+    servers = []
+
+    def start(fail_rate=0.0, latency=0.0, connections=None):
+        # `connections`, if given, gets the client address of every connection accepted
+        output_dir = tmp_path / "received"
+        output_dir.mkdir(exist_ok=True)
+
+        def setup(self):
+            ReceiverHandler.setup(self)
+            if connections is not None:
+                connections.append(self.client_address)
+
+        handler = type("Handler", (ReceiverHandler,), {
+            "output_dir": str(output_dir),
+            "api_key": KEY,
+            "store": ResumableStore(str(output_dir)),
+            "fail_rate": fail_rate,
+            "latency": latency,
+            "setup": setup,
+            "log_message": lambda self, *args: None,
+        })
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/upload", output_dir
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def upload_path(tmp_path):
+    # A few MiB that compress, with random bytes mixed in, spanning several read chunks
+    rng = random.Random(0)
+    data = b"".join(
+        rng.randbytes(512) + b"hash,repository,date,author,language\n" * rng.randint(1, 200) for _ in range(2000)
+    )
+    path = tmp_path / "commits.csv"
+    path.write_bytes(data)
+    return path
+
+
+@pytest.mark.parametrize("compression", [None, "gzip", "zstd"])
+def test_upload_matches_file(receiver, upload_path, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    url, output_dir = receiver()
+    session = RecordingSession()
+
+    assert upload_file(str(upload_path), url, "user", KEY, compression=compression, session=session)
+
+    expected = hashlib.sha256(upload_path.read_bytes()).hexdigest()
+    received = session.responses[-1].json()
+    assert received["fields"] == {"user_id": "user"}
+    assert received["files"][0]["sha256"] == expected
+    assert received["files"][0]["bytes"] == upload_path.stat().st_size
+    assert (output_dir / "commits.csv").read_bytes() == upload_path.read_bytes()
+    if compression:
+        assert received["wire_bytes"] < upload_path.stat().st_size
+
+
+def test_upload_with_wrong_key_fails(receiver, upload_path):
+    url, output_dir = receiver()
+
+    assert not upload_file(str(upload_path), url, "user", "wrong-key")
+    assert not (output_dir / "commits.csv").exists()
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_resumable_upload_survives_dropped_requests(receiver, upload_path, monkeypatch, compression):
+    # A fixed seed makes the receiver drop the same share of chunk requests, before
+    # or after storing them, on every run
+    random.seed(1234)
+    monkeypatch.setattr(upload_to_endpoint, "BACKOFF_BASE", 0.001)
+    url, output_dir = receiver(fail_rate=0.3)
+    session = RecordingSession()
+    chunk_size = 64 << 10
+
+    assert upload_file_resumable(
+        str(upload_path), url, "user", KEY,
+        compression=compression, chunk_size=chunk_size, max_retries=10, session=session,
+    )
+
+    expected = hashlib.sha256(upload_path.read_bytes()).hexdigest()
+    assert session.responses[-1].json()["files"][0]["sha256"] == expected
+    assert (output_dir / "commits.csv").read_bytes() == upload_path.read_bytes()
+    # Failed chunks were sent again: more chunk requests than chunks
+    chunks = -(-upload_path.stat().st_size // chunk_size)
+    assert session.methods.count("PUT") > chunks
+
+
+def test_resumable_upload_continues_from_acknowledged_offset(receiver, upload_path):
+    url, output_dir = receiver()
+    chunk_size = 256 << 10
+
+    # The first attempt stops after two chunks, as if the job had been killed
+    class FailingSession(RecordingSession):
+        def request(self, method, url, *args, **kwargs):
+            if method == "PUT" and self.methods.count("PUT") == 2:
+                raise requests.ConnectionError("connection lost")
+            return super().request(method, url, *args, **kwargs)
+
+    assert not upload_file_resumable(
+        str(upload_path), url, "user", KEY, chunk_size=chunk_size, max_retries=0, session=FailingSession()
+    )
+    assert not (output_dir / "commits.csv").exists()
+
+    session = RecordingSession()
+    assert upload_file_resumable(str(upload_path), url, "user", KEY, chunk_size=chunk_size, session=session)
+
+    assert session.responses[-1].json()["files"][0]["sha256"] == hashlib.sha256(upload_path.read_bytes()).hexdigest()
+    assert (output_dir / "commits.csv").read_bytes() == upload_path.read_bytes()
+    chunks = -(-upload_path.stat().st_size // chunk_size)
+    assert session.methods.count("PUT") == chunks - 2
+
+
+def test_upload_files_concurrently_over_pooled_connections(receiver, tmp_path):
+    connections = []
+    url, output_dir = receiver(latency=0.3, connections=connections)
+    source = tmp_path / "out"
+    (source / "nested").mkdir(parents=True)
+    for i in range(8):
+        (source / ("nested" if i % 2 else "") / f"part-{i}.csv").write_bytes(f"row {i}\n".encode() * (1000 + i))
+    (source / ".hidden").write_text("skipped\n")
+    paths = list(collect_files([str(source), str(tmp_path / "missing.csv")]))
+
+    started = time.monotonic()
+    results = upload_files(paths, url, "user", KEY, concurrency=4)
+    elapsed = time.monotonic() - started
+
+    assert [result.file_path for result in results] == paths
+    assert [result.success for result in results] == [True] * 8 + [False]
+    for path in paths[:-1]:
+        with open(path, "rb") as f:
+            assert (output_dir / path.rsplit("/", 1)[-1]).read_bytes() == f.read()
+    assert not (output_dir / ".hidden").exists()
+    # Eight requests of 0.3s each, four at a time, on at most four kept-alive connections
+    assert elapsed < 8 * 0.3 * 0.75
+    assert len(connections) <= 4
+
+
+@pytest.mark.parametrize("output_format, compression", [("csv", None), ("csv", "gzip"), ("parquet", None)])
+def test_extractor_streams_output_to_endpoint(receiver, make_repo, tmp_path, monkeypatch, output_format, compression):
+    if output_format == "parquet":
+        pytest.importorskip("pyarrow")
+    repo = make_repo(tmp_path / "repo", [
+        (f"2024-01-0{day}T12:00:00", "ana@example.com", {f"file{day}.py": "x\n" * day * 1000}) for day in range(1, 6)
+    ])
+    url, output_dir = receiver()
+    window = ["-s", "2024-01-01", "-e", "2024-01-31", "--format", output_format]
+    monkeypatch.chdir(tmp_path)
+
+    monkeypatch.setattr(sys, "argv", ["extractor", str(repo), *window, "-o", str(tmp_path / "local.out")])
+    canaicode_git_extractor.main()
+    upload = ["--upload-url", url, "--user-id", "user", "--upload-key", KEY]
+    if compression:
+        upload += ["--upload-compression", compression]
+    extract_dir = tmp_path / "extract"
+    extract_dir.mkdir()
+    monkeypatch.chdir(extract_dir)
+    monkeypatch.setattr(sys, "argv", ["extractor", str(repo), *window, *upload])
+    open_sessions = []
+    create_session = upload_to_endpoint.create_session
+
+    def tracked_create_session(*args, **kwargs):
+        session = create_session(*args, **kwargs)
+        close = session.close
+
+        def tracked_close():
+            open_sessions.remove(session)
+            close()
+
+        session.close = tracked_close
+        open_sessions.append(session)
+        return session
+
+    monkeypatch.setattr(upload_to_endpoint, "create_session", tracked_create_session)
+    canaicode_git_extractor.main()
+    # The upload's connection pool is closed with the run
+    assert not open_sessions
+
+    # Nothing was written locally, and the endpoint got what -o writes
+    assert not list(extract_dir.iterdir())
+    received = output_dir / f"commits_2024-01-01_to_2024-01-31.{output_format}"
+    assert received.read_bytes() == (tmp_path / "local.out").read_bytes()
+
+
+def test_extractor_fails_when_streamed_upload_is_rejected(receiver, make_repo, tmp_path, monkeypatch):
+    repo = make_repo(tmp_path / "repo", [("2024-01-02T12:00:00", "ana@example.com", {"app.py": "x\n"})])
+    url, output_dir = receiver()
+    state_file = tmp_path / "state.json"
+    monkeypatch.setattr(sys, "argv", [
+        "extractor", str(repo), "-s", "2024-01-01", "-e", "2024-01-31", "--state-file", str(state_file),
+        "--upload-url", url, "--user-id", "user", "--upload-key", "wrong-key",
+    ])
+
+    with pytest.raises(SystemExit) as exit_info:
+        canaicode_git_extractor.main()
+    assert exit_info.value.code == 1
+    # The checkpoints only move once the rows were delivered
+    assert not state_file.exists()
+    assert not (output_dir / "commits_2024-01-01_to_2024-01-31.csv").exists()
+
+
+def test_manifest_keeps_same_named_files_in_different_directories_apart(receiver, tmp_path, monkeypatch, capsys):
+    url, _ = receiver()
+    partitions = tmp_path / "partitions"
+    for repository in ("api", "web"):
+        (partitions / repository).mkdir(parents=True)
+        (partitions / repository / "2024-01-02.csv").write_text(f"{repository} rows\n")
+    manifest = tmp_path / "uploads.json"
+    argv = ["upload", str(partitions), "--url", url, "--user-id", "user", "--key", KEY, "--manifest", str(manifest)]
+
+    def upload():
+        monkeypatch.setattr(sys, "argv", argv)
+        with pytest.raises(SystemExit) as exit_info:
+            upload_to_endpoint.main()
+        assert exit_info.value.code == 0
+        return capsys.readouterr().out
+
+    assert "Skipping 0 of 2 files" in upload()
+    assert set(json.loads(manifest.read_text())[url]["user"]) == {"api/2024-01-02.csv", "web/2024-01-02.csv"}
+    assert "Skipping 2 of 2 files" in upload()
+
+    # Only the changed partition is sent again
+    (partitions / "web" / "2024-01-02.csv").write_text("web rows\nmore rows\n")
+    assert "Skipping 1 of 2 files" in upload()
+    assert "Skipping 2 of 2 files" in upload()